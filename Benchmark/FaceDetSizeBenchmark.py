@@ -0,0 +1,112 @@
+import argparse
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+# 讓 python Benchmark/FaceDetSizeBenchmark.py 也能直接執行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Core.FaceRecognition.FaceEmbeddingStore import scanGallery
+from Manager.OCSortTracker.association import iou_batch
+
+
+class SyntheticScenes:
+    """用 KnownFaces 的照片合成畫面：把照片縮放到臉為指定大小，隨機貼到灰色背景上，臉框即為 ground truth"""
+    def __init__(self, detector, known_path, width=640, height=480, faces_per_scene=3, seed=0):
+        self.detector = detector
+        self.width = width
+        self.height = height
+        self.faces_per_scene = faces_per_scene
+        self.rng = np.random.default_rng(seed)
+        self.sources = self.loadSources(known_path)
+
+    def loadSources(self, known_path):
+        # 每張照片先用最大的 size 找出 (唯一的) 臉框
+        sources = []
+        for _, img_path in scanGallery(known_path).values():
+            img = cv2.imdecode(np.fromfile(str(img_path), dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            bboxes, _ = self.detector.detect(img, input_size=(640, 640), max_num=0, metric="default")
+            if bboxes.shape[0] == 1:
+                sources.append((img, bboxes[0, :4]))
+        if not sources:
+            raise RuntimeError(f"{known_path} 沒有可用的照片 (每張需剛好一張臉)")
+        return sources
+
+    def generate(self, face_size, max_tries=20):
+        # 回傳 (畫面, gt 臉框 [N, 4])
+        # 後貼的照片不能蓋到之前的 gt 臉 (否則被蓋掉的臉還算在 total 裡，召回率偏低)，放不下就重抽位置，還是不行就少貼一張
+        scene = np.full((self.height, self.width, 3), 127, dtype=np.uint8)
+        boxes = []
+        for _ in range(self.faces_per_scene):
+            img, bbox = self.sources[self.rng.integers(len(self.sources))]
+            scale = face_size / max(bbox[2] - bbox[0], 1.0)
+            resized = cv2.resize(img, (max(int(img.shape[1] * scale), 1), max(int(img.shape[0] * scale), 1)))
+            h, w = min(resized.shape[0], self.height), min(resized.shape[1], self.width)
+            for _ in range(max_tries):
+                x = int(self.rng.integers(0, self.width - w + 1))
+                y = int(self.rng.integers(0, self.height - h + 1))
+                if not any(x < bx2 and bx1 < x + w and y < by2 and by1 < y + h for bx1, by1, bx2, by2 in boxes):
+                    break
+            else:
+                continue
+            scene[y:y + h, x:x + w] = resized[:h, :w]
+            box = bbox * scale + [x, y, x, y]
+            if box[2] <= x + w and box[3] <= y + h:  # 臉被裁掉的不算
+                boxes.append(box)
+        return scene, np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def measure(detector, scenes, size, runs=3):
+    # 回傳 (每次偵測的延遲 ms, 召回率)
+    latencies = []
+    found, total = 0, 0
+    for scene, gt in scenes:
+        best = np.inf
+        for _ in range(runs):
+            start = time.perf_counter()
+            bboxes, _ = detector.detect(scene, input_size=(size, size), max_num=0, metric="default")
+            best = min(best, time.perf_counter() - start)
+        latencies.append(best * 1000)
+        total += len(gt)
+        if len(gt) and bboxes.shape[0]:
+            found += int(np.sum(iou_batch(gt, bboxes[:, :4]).max(axis=1) >= 0.5))
+    return float(np.mean(latencies)), found / max(total, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SCRFD 偵測大小 (det_size) 的延遲與召回率")
+    parser.add_argument("--known", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Core", "FaceRecognition", "KnownFaces"))
+    parser.add_argument("--sizes", type=int, nargs="*", default=[160, 320, 480, 640], help="偵測大小")
+    parser.add_argument("--face-sizes", type=int, nargs="*", default=[12, 16, 24, 32, 48, 64, 96], help="畫面上的臉大小 (px)")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--scenes", type=int, default=20, help="每種臉大小的畫面數")
+    parser.add_argument("--ctx-id", type=int, default=-1, help="-1: CPU, 0: GPU")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import insightface
+    app = insightface.app.FaceAnalysis(name="buffalo_l", allowed_modules=["detection"])
+    app.prepare(ctx_id=args.ctx_id, det_size=(320, 320))
+    detector = app.models["detection"]
+    for size in args.sizes:  # warm-up
+        detector.detect(np.zeros((args.height, args.width, 3), dtype=np.uint8), input_size=(size, size), max_num=0, metric="default")
+
+    generator = SyntheticScenes(detector, args.known, args.width, args.height, seed=args.seed)
+    print(f"畫面 {args.width}x{args.height}，每格: 延遲 ms / 召回率")
+    print(f"{'face px':>8} " + " ".join(f"{size:>15}" for size in args.sizes))
+    for face_size in args.face_sizes:
+        scenes = [generator.generate(face_size) for _ in range(args.scenes)]
+        cells = []
+        for size in args.sizes:
+            latency, recall = measure(detector, scenes, size)
+            cells.append(f"{latency:7.2f} / {recall:5.3f}")
+        print(f"{face_size:>8} " + " ".join(f"{cell:>15}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
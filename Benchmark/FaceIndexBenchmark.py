@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# 讓 python Benchmark/FaceIndexBenchmark.py 也能直接執行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Core.FaceRecognition.FaceIndex import FaceIndex, FACE_INDEX_TYPES, FACE_INDEX_STORAGES
+
+
+class SyntheticGallery:
+    """產生合成人臉庫：每個人一個中心向量，每張照片在中心附近加雜訊 (皆為單位向量)"""
+    def __init__(self, size=1000, samples_per_person=5, dim=512, spread=0.9, query_noise=1.3, seed=0):
+        self.size = size
+        self.samples_per_person = samples_per_person
+        self.dim = dim
+        self.spread = spread  # 同一人不同照片的差異
+        self.query_noise = query_noise  # 攝影機畫面和人臉庫照片的差異
+        self.rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def normalize(x):
+        return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+    def noisy(self, centers, scale):
+        return self.normalize(centers + self.rng.normal(0, scale / np.sqrt(self.dim), centers.shape))
+
+    def generate(self, queries=500):
+        persons = max(1, self.size // self.samples_per_person)
+        centers = self.normalize(self.rng.normal(size=(persons, self.dim)))
+        labels = np.arange(self.size) % persons
+        gallery = self.noisy(centers[labels], self.spread)
+        query_labels = self.rng.integers(0, persons, queries)
+        query = self.noisy(centers[query_labels], self.query_noise)
+        names = {i: f"person_{label}" for i, label in enumerate(labels)}
+        return gallery, names, query, query_labels
+
+
+def measure(index, query, names, runs=3):
+    # 回傳 (每個 query 的延遲 ms, 投票後選出的 index)
+    best = np.inf
+    for _ in range(runs):
+        start = time.perf_counter()
+        for q in query:
+            index.searchByPerson(q[None, :], names)
+        best = min(best, time.perf_counter() - start)
+    _, I = index.searchByPerson(query, names)
+    return best / len(query) * 1000, I
+
+
+def run(sizes, index_types, storages, args):
+    results = []
+    for size in sizes:
+        gallery, names, query, query_labels = SyntheticGallery(size, args.samples_per_person, seed=args.seed).generate(args.queries)
+        truth = np.array([f"person_{label}" for label in query_labels])
+
+        flat = FaceIndex(index_type="flat", top_k=args.top_k)
+        flat.build(gallery)
+        _, flat_I = measure(flat, query, names, runs=1)
+        flat_names = np.array([names[i] for i in flat_I])
+
+        for index_type in index_types:
+            for storage in storages:
+                index = FaceIndex(index_type=index_type, top_k=args.top_k, nlist=args.nlist, nprobe=args.nprobe,
+                                  hnsw_m=args.hnsw_m, ef_search=args.ef_search, storage=storage, pq_m=args.pq_m)
+                start = time.perf_counter()
+                index.build(gallery)
+                build_time = time.perf_counter() - start
+
+                latency, I = measure(index, query, names)
+                found = np.array([names[i] if i >= 0 else "" for i in I])
+                results.append({
+                    "size": size,
+                    "index": index_type,
+                    "storage": storage,
+                    "build_s": build_time,
+                    "latency_ms": latency,
+                    "bytes_per_face": index.memoryBytes() / size,  # 索引 (含 id 對照 / 圖結構) 的記憶體
+                    "recall_vs_flat": float(np.mean(found == flat_names)),  # 和暴力搜尋選出同一個人的比例
+                    "accuracy": float(np.mean(found == truth)),
+                })
+                print(f"{size:>8} {index_type:>5} {storage:>7}  build {build_time:7.2f}s  {latency:8.3f} ms/query  "
+                      f"{results[-1]['bytes_per_face']:7.0f} B/face  "
+                      f"recall(vs flat) {results[-1]['recall_vs_flat']:.3f}  accuracy {results[-1]['accuracy']:.3f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FaceIndex (flat / ivf / hnsw × flat / fp16 / sq8 / pq) 召回率、延遲與記憶體測試")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 50000], help="人臉庫大小 (照片數)")
+    parser.add_argument("--index", choices=FACE_INDEX_TYPES, nargs="*", default=list(FACE_INDEX_TYPES))
+    parser.add_argument("--storage", choices=FACE_INDEX_STORAGES, nargs="*", default=list(FACE_INDEX_STORAGES))
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ 子空間數 (每張臉 bytes)")
+    parser.add_argument("--samples-per-person", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'index':>5} {'storage':>7}")
+    run(args.sizes, args.index, args.storage, args)
+
+
+if __name__ == "__main__":
+    main()
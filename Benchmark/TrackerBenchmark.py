@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# 讓 python Benchmark/TrackerBenchmark.py 也能直接執行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Manager.OCSortManager import OCSortManager
+from Manager.OCSortTracker.association import iou_batch, linear_assignment
+
+# 預設情境 (可用命令列參數覆寫)
+SCENARIOS = {
+    "sparse":   {"objects": 5,  "speed": 3.0, "occlusion": 0.0,  "occlusion_len": 0,  "noise": 1.0},
+    "crowded":  {"objects": 40, "speed": 5.0, "occlusion": 0.0,  "occlusion_len": 0,  "noise": 1.0},
+    "occluded": {"objects": 10, "speed": 4.0, "occlusion": 0.05, "occlusion_len": 10, "noise": 1.0},
+    "noisy":    {"objects": 10, "speed": 4.0, "occlusion": 0.01, "occlusion_len": 5,  "noise": 4.0},
+}
+
+
+class SyntheticSequence:
+    """產生多目標等速移動 (碰壁反彈) 的合成序列，含遮擋與偵測雜訊"""
+    def __init__(self, objects=10, frames=500, speed=4.0, occlusion=0.0, occlusion_len=0, noise=1.0,
+                 width=640, height=480, seed=0):
+        self.objects = objects
+        self.frames = frames
+        self.speed = speed
+        self.occlusion = occlusion  # 每個物體每一幀開始被遮擋的機率
+        self.occlusion_len = occlusion_len  # 遮擋的最長幀數
+        self.noise = noise  # 偵測框座標雜訊 (像素標準差)
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+
+    def generate(self):
+        # 回傳每一幀的 (gt_boxes, gt_ids, det_boxes, det_scores)
+        rng = self.rng
+        sizes = rng.uniform(40, 120, size=(self.objects, 2))
+        pos = rng.uniform([0, 0], [self.width, self.height], size=(self.objects, 2))
+        angle = rng.uniform(0, 2 * np.pi, size=self.objects)
+        vel = np.stack([np.cos(angle), np.sin(angle)], axis=1) * self.speed * rng.uniform(0.5, 1.5, size=(self.objects, 1))
+        hidden = np.zeros(self.objects, dtype=int)  # 剩餘遮擋幀數
+        ids = np.arange(self.objects)
+
+        sequence = []
+        for _ in range(self.frames):
+            pos += vel
+            # 碰到邊界反彈
+            half = sizes / 2
+            low = pos - half < 0
+            high = pos + half > [self.width, self.height]
+            vel[low | high] *= -1
+            pos = np.clip(pos, half, np.array([self.width, self.height]) - half)
+
+            gt = np.concatenate([pos - half, pos + half], axis=1)
+
+            # 遮擋
+            hidden = np.maximum(hidden - 1, 0)
+            if self.occlusion > 0 and self.occlusion_len > 0:
+                start = (hidden == 0) & (rng.random(self.objects) < self.occlusion)
+                hidden[start] = rng.integers(1, self.occlusion_len + 1, size=start.sum())
+            visible = hidden == 0
+
+            dets = gt[visible] + rng.normal(0, self.noise, size=(visible.sum(), 4))
+            scores = rng.uniform(0.5, 1.0, size=visible.sum())
+            sequence.append((gt, ids, dets, scores))
+        return sequence
+
+
+class TrackerBenchmark:
+    def __init__(self, sequence, width=640, height=480, iou_threshold=0.5):
+        self.sequence = sequence
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)  # objectTrack 只會讀取 frame.shape
+        self.iou_threshold = iou_threshold
+
+    def runTiming(self):
+        trackerMgr = OCSortManager()
+        latencies = []
+        outputs = []
+        for gt, ids, dets, scores in self.sequence:
+            bboxes = [tuple(b) for b in dets]
+            start = time.perf_counter()
+            tracks = trackerMgr.objectTrack(self.frame, bboxes, scores)
+            latencies.append((time.perf_counter() - start) * 1000)
+            outputs.append(tracks)
+        return np.array(latencies), outputs
+
+    def runAllocation(self):
+        # tracemalloc 會拖慢速度，所以和計時分開跑
+        trackerMgr = OCSortManager()
+        per_frame = []
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for gt, ids, dets, scores in self.sequence:
+            bboxes = [tuple(b) for b in dets]
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            trackerMgr.objectTrack(self.frame, bboxes, scores)
+            per_frame.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        return np.array(per_frame), retained
+
+    def evaluate(self, outputs):
+        # 以 IoU 做 GT 與追蹤結果的配對，計算 ID switch 與覆蓋率
+        last_match = {}
+        id_switches = 0
+        matched_total = 0
+        gt_total = 0
+        for (gt, ids, dets, scores), tracks in zip(self.sequence, outputs):
+            gt_total += len(gt)
+            if len(tracks) == 0:
+                continue
+            trk = np.stack([tracks["x1"], tracks["y1"], tracks["x2"], tracks["y2"]], axis=1).astype(float)
+            trk_ids = tracks["track_id"].tolist()
+            iou = iou_batch(gt, trk)
+            for g, t in linear_assignment(-iou):
+                if iou[g, t] < self.iou_threshold:
+                    continue
+                matched_total += 1
+                gt_id = ids[g]
+                if gt_id in last_match and last_match[gt_id] != trk_ids[t]:
+                    id_switches += 1
+                last_match[gt_id] = trk_ids[t]
+        return {
+            "id_switches": id_switches,
+            "recall": matched_total / gt_total if gt_total else 0.0,
+            "unique_ids": len({track_id for tracks in outputs for track_id in tracks["track_id"].tolist()}),
+        }
+
+    def run(self):
+        latencies, outputs = self.runTiming()
+        allocations, retained = self.runAllocation()
+        result = {
+            "frames": len(self.sequence),
+            "latency_p50_ms": float(np.percentile(latencies, 50)),
+            "latency_p90_ms": float(np.percentile(latencies, 90)),
+            "latency_p99_ms": float(np.percentile(latencies, 99)),
+            "latency_max_ms": float(latencies.max()),
+            "alloc_peak_mean_kb": float(allocations.mean() / 1024),
+            "alloc_peak_max_kb": float(allocations.max() / 1024),
+            "retained_kb": retained / 1024,
+        }
+        result.update(self.evaluate(outputs))
+        return result
+
+
+def compare(results, baseline, latency_tolerance, quality_tolerance):
+    # 和先前存下的結果比較，回傳發現的退步項目
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["latency_p90_ms"] > base["latency_p90_ms"] * (1 + latency_tolerance):
+            regressions.append(f"{name}: latency_p90_ms {base['latency_p90_ms']:.3f} -> {result['latency_p90_ms']:.3f}")
+        if result["id_switches"] > base["id_switches"] * (1 + quality_tolerance) + 1:
+            regressions.append(f"{name}: id_switches {base['id_switches']} -> {result['id_switches']}")
+        if result["recall"] < base["recall"] * (1 - quality_tolerance):
+            regressions.append(f"{name}: recall {base['recall']:.4f} -> {result['recall']:.4f}")
+    return regressions
+
+
+def printResults(results):
+    header = f"{'scenario':<10} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'allocKB':>8} {'retainKB':>9} {'IDsw':>5} {'recall':>7} {'IDs':>5}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<10} {r['latency_p50_ms']:7.3f} {r['latency_p90_ms']:7.3f} {r['latency_p99_ms']:7.3f} "
+              f"{r['latency_max_ms']:7.3f} {r['alloc_peak_mean_kb']:8.1f} {r['retained_kb']:9.1f} "
+              f"{r['id_switches']:5d} {r['recall']:7.4f} {r['unique_ids']:5d}")
+    print("(latency 單位為 ms/frame，allocKB 為每幀平均配置峰值)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCSort 追蹤器合成序列效能測試")
+    parser.add_argument("--scenario", choices=list(SCENARIOS.keys()), nargs="*", help="要跑的情境 (預設全部)")
+    parser.add_argument("--objects", type=int, help="物體數量 (覆寫情境設定)")
+    parser.add_argument("--speed", type=float, help="移動速度 px/frame (覆寫情境設定)")
+    parser.add_argument("--occlusion", type=float, help="每幀開始遮擋的機率 (覆寫情境設定)")
+    parser.add_argument("--occlusion-len", type=int, help="遮擋最長幀數 (覆寫情境設定)")
+    parser.add_argument("--noise", type=float, help="偵測框雜訊標準差 px (覆寫情境設定)")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="把結果存成 JSON，之後可當作 baseline")
+    parser.add_argument("--baseline", help="和先前的 JSON 結果比較，有退步時回傳非 0")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25)
+    parser.add_argument("--quality-tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenario or SCENARIOS.keys():
+        config = dict(SCENARIOS[name])
+        for key in ("objects", "speed", "occlusion", "occlusion_len", "noise"):
+            if getattr(args, key) is not None:
+                config[key] = getattr(args, key)
+        sequence = SyntheticSequence(frames=args.frames, seed=args.seed, **config).generate()
+        results[name] = TrackerBenchmark(sequence).run()
+
+    printResults(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"結果已儲存: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.latency_tolerance, args.quality_tolerance)
+        if regressions:
+            print("[退步] 與 baseline 比較發現退步:")
+            for r in regressions:
+                print(f"  {r}")
+            sys.exit(1)
+        print("[通過] 與 baseline 比較沒有退步")
+
+
+if __name__ == "__main__":
+    main()
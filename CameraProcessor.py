@@ -4,10 +4,12 @@ import time
 from Core.MotionDetector.MotionDetector import MotionDetector
 # from Core.MotionTracker.MotionTracker import MotionTracker
 from Core.FaceRecognition.FaceRecognition import FaceRecognition
+from Core.FaceRecognition.FaceManager import faceMgr
 from Core.MotionPipeline.MotionPipeline import MotionPipeline
 from Manager.KeyboardManager import KeyboardManager, KeyboardLayoutCode
 from Manager.HttpManager import HttpManager, httpMgr
 from Manager.CrossLineManager import CrossLineManager
+from Manager.SnapshotManager import snapshotMgr
 from Utils.Capture import Capture
 from dotenv import load_dotenv
 
@@ -23,10 +25,22 @@ class CarmeraProcessor:
         self.setupCameraProperties()
         
         self.motion_detector = MotionDetector(self.headless)
+        # 人臉偵測的候選區域：full = 整張偵測，motion = 只在有動靜的區域 (和上一幀的人臉) 偵測
+        self.face_detect_regions = os.getenv("FACE_DETECT_REGIONS", "full").lower()
+        self.face_motion_detector = MotionDetector(self.headless)  # motion_enable 關閉時自己算動靜區域 (不告警)
         # self.motion_tracker = MotionTracker(self.headless)
-        self.face_recognizer = FaceRecognition(self.headless)
+        self.face_recognizer = FaceRecognition(self.headless, str(camera_index))
         self.crossLineMgr = CrossLineManager(cv_window_name = "Face Recognition", headless = self.headless)
-        self.pipeline = MotionPipeline(self.headless) 
+        self.pipeline = MotionPipeline(self.headless, str(camera_index)) 
+        self.face_recognizer.trackerMgr.addTrackEndListener(self.crossLineMgr.onTrackEnded)
+
+        # 重啟時還原追蹤器與識別快取 (快照夠新才會還原)
+        snapshotMgr.setSource(camera_index)
+        snapshotMgr.register("faceTracker", self.face_recognizer.trackerMgr)
+        snapshotMgr.register("pipelineTracker", self.pipeline.trackerMgr)
+        snapshotMgr.register("pipeline", self.pipeline)
+        snapshotMgr.register("faceManager", faceMgr)
+        snapshotMgr.restore()
         
         # http parameter
         self.motion_enable = False
@@ -72,6 +86,7 @@ class CarmeraProcessor:
             
             # 重新初始化受解析度影響的組件
             self.motion_detector.pre_frame = None
+            self.face_motion_detector.pre_frame = None
             
             return True
         return False
@@ -79,6 +94,7 @@ class CarmeraProcessor:
     def Process(self, frame):
         try:
             # Motion Detection
+            thresh = None
             if self.motion_enable:
                 motion_detected, motion_frame, thresh = self.motion_detector.start(frame.copy())
                 httpMgr.update_frame('motion', motion_frame)
@@ -86,17 +102,24 @@ class CarmeraProcessor:
 
             # Face Recognition
             if self.face_enable or self.crossLine_enable:
-                face_frame, face_info = self.face_recognizer.start(frame.copy())
+                regions = None
+                if self.face_detect_regions == "motion":
+                    if thresh is None:
+                        thresh = self.face_motion_detector.diff(frame)
+                    regions = self.motion_detector.findRegions(thresh)
+                face_frame, face_info = self.face_recognizer.start(frame.copy(), regions)
                 httpMgr.update_frame('face', face_frame)
                 httpMgr.update_face_info(face_info)
 
                 #Cross Line Detection
                 if self.crossLine_enable:
                     crossline_frame = frame.copy()
-                    for (x1, y1, x2, y2, track_id, name) in face_info:
+                    for face in face_info:
+                        x1, y1, x2, y2 = face["bbox"]
+                        track_id, name = face["track_id"], face["name"]
                         center = (int((x1 + x2) / 2), int((y1 + y2) / 2))
                         cv2.circle(crossline_frame, center, 5, (255, 0, 0), -1)
-                        if(self.crossLineMgr.is_cross_line(center, track_id)):
+                        if(self.crossLineMgr.isCrossLine(center, face["track_key"])):
                             print(f"{track_id} {name}: Cross Line Detected! {center}")
                             httpMgr.update_crossline_info(f"{name}")
                     self.crossLineMgr.drawLine(crossline_frame)
@@ -115,6 +138,15 @@ class CarmeraProcessor:
         except Exception as e:
             print(f"Process frame error: {e}")
 
+    def getCacheSizes(self):
+        # 各元件 per-track 快取的大小，確認長時間執行沒有累積
+        return {
+            "face": self.face_recognizer.getCacheSizes(),
+            "crossline": {"prev_center": len(self.crossLineMgr.prev_center)},
+            "pipeline": self.pipeline.getCacheSizes(),
+            "faceManager": faceMgr.getCacheSizes(),
+        }
+
     def keyHandler(self, frame):
         if self.headless:
             return True  # 無頭模式下不處理鍵盤事件
@@ -168,6 +200,7 @@ class CarmeraProcessor:
                     break
 
                 self.Process(frame)
+                snapshotMgr.update()
 
             except Exception as e:
                 print(f"攝影機讀取錯誤: {e}")
@@ -176,6 +209,7 @@ class CarmeraProcessor:
                 time.sleep(0.1)  # 短暫等待後重試
                 continue
             
+        snapshotMgr.save()
         self.cap.release()
         if not self.headless:
             cv2.destroyAllWindows()
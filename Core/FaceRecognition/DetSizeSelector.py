@@ -0,0 +1,52 @@
+import time
+from collections import deque
+
+# 每次偵測依輸入大小和這支攝影機最近看到的臉大小，從幾個固定的 det_size 裡挑一個 (SCRFD detect 的 input_size，不用重新 prepare)
+# 最小的臉縮放後還有 min_face_px 就夠了；輸入本身比 det_size 小時不放大；
+# 每隔 probe_interval 次用最大的 size 偵測一次，才找得到比最近看過的更小 (更遠) 的臉
+class DetSizeSelector:
+    def __init__(self, sizes=(160, 320, 480, 640), default_size=320, min_face_px=24, window=10.0, probe_interval=30):
+        self.sizes = sorted(sizes)
+        self.default_size = min(self.sizes, key=lambda size: abs(size - default_size))  # 還沒有任何臉的記錄時使用
+        self.min_face_px = min_face_px  # 臉 (短邊) 縮放到偵測器輸入後至少要這麼大
+        self.window = window  # 秒，只看最近這段時間的臉
+        self.probe_interval = probe_interval
+        self.history = {}  # {source: {"faces": deque[(timestamp, 臉短邊 px)], "calls": int}}，source 例如 (stream, tracker)
+        self.stats = {size: 0 for size in self.sizes}
+
+    def fitSize(self, shape):
+        # 不放大輸入：比輸入長邊大的 size 都沒有意義，取剛好蓋住長邊的那個
+        longest = max(shape[:2])
+        return next((size for size in self.sizes if size >= longest), self.sizes[-1])
+
+    def choose(self, source, shape, now=None):
+        now = time.time() if now is None else now
+        state = self.history.setdefault(source, {"faces": deque(maxlen=64), "calls": 0})
+        state["calls"] += 1
+        while state["faces"] and now - state["faces"][0][0] > self.window:
+            state["faces"].popleft()
+
+        cap = self.fitSize(shape)
+        if state["calls"] % self.probe_interval == 0:
+            size = self.sizes[-1]
+        elif not state["faces"]:
+            size = self.default_size
+        else:
+            # 最小的臉要放大到 min_face_px：縮放比例 = size / 長邊
+            smallest = min(face for _, face in state["faces"])
+            needed = self.min_face_px * max(shape[:2]) / max(smallest, 1.0)
+            size = next((s for s in self.sizes if s >= needed), self.sizes[-1])
+        size = min(size, cap)
+        self.stats[size] += 1
+        return size
+
+    def observe(self, source, faces, now=None):
+        # faces: 偵測結果 (bbox 為輸入影像座標)
+        now = time.time() if now is None else now
+        state = self.history.setdefault(source, {"faces": deque(maxlen=64), "calls": 0})
+        for face in faces:
+            x1, y1, x2, y2 = face.bbox[:4]
+            state["faces"].append((now, float(min(x2 - x1, y2 - y1))))
+
+    def getStats(self):
+        return dict(self.stats)
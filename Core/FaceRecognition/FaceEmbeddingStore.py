@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+
+def scanGallery(known_path):
+    # KnownFaces/<人名>/<圖片> 只列出檔案 {rel_path: (name, path)}，不讀圖
+    known_path = Path(known_path)
+    files = {}
+    for person_dir in sorted(known_path.iterdir()):
+        if not person_dir.is_dir():
+            continue
+        for img_path in sorted(person_dir.glob("*")):
+            if img_path.is_file():
+                files[img_path.relative_to(known_path).as_posix()] = (person_dir.name, img_path)
+    return files
+
+
+# KnownFaces 的特徵快取：每張圖片以 (相對路徑, 檔案大小, mtime) 判斷是否變更，mtime 變了再比對內容 hash
+# 特徵存成 float32 矩陣 (embeddings.npy)，啟動時直接 memory-map，只有新增/變更的圖片需要重新抽特徵
+# 建好的 FAISS 索引也可以存成 index.faiss (和 meta.json 對得上才會被載入)，PQ / IVF 不用每次啟動重新訓練
+class FaceEmbeddingStore:
+    def __init__(self, store_path, dim=512):
+        self.store_path = Path(store_path)
+        self.meta_path = self.store_path / "meta.json"
+        self.matrix_path = self.store_path / "embeddings.npy"
+        self.index_path = self.store_path / "index.faiss"
+        self.index_meta_path = self.store_path / "index.json"
+        self.dim = dim
+        self.entries = {}  # {rel_path: {"name", "size", "mtime_ns", "sha1", "row"}}，row = -1 表示該圖被拒絕 (0 或多張臉)
+        self.embeddings = np.empty((0, dim), dtype=np.float32)
+        self.lock = threading.Lock()  # 啟動、自我學習、熱更新都可能寫入
+        self.load()
+
+    def load(self):
+        if not self.meta_path.exists() or not self.matrix_path.exists():
+            return
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            embeddings = np.load(self.matrix_path, mmap_mode="r")
+            rows = [entry["row"] for entry in entries.values()]
+            if embeddings.ndim != 2 or embeddings.shape[1] != self.dim or max(rows, default=-1) >= embeddings.shape[0]:
+                raise ValueError(f"shape {embeddings.shape} 與 meta 不符")
+            self.entries = entries
+            self.embeddings = embeddings
+            print(f"[特徵快取] 已載入 {len(self.entries)} 筆記錄 ({self.matrix_path})")
+        except Exception as e:
+            print(f"[特徵快取] 讀取失敗，將重新建立: {e}")
+            self.entries = {}
+            self.embeddings = np.empty((0, self.dim), dtype=np.float32)
+
+    @staticmethod
+    def fileHash(path):
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def fileInfo(path, with_hash=True):
+        stat = os.stat(path)
+        info = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if with_hash:
+            info["sha1"] = FaceEmbeddingStore.fileHash(path)
+        return info
+
+    def lookup(self, rel_path, path):
+        # 命中回傳記錄的複本 (含舊的 row)，沒有記錄或內容已變更回傳 None
+        entry = self.entries.get(rel_path)
+        if entry is None:
+            return None
+        info = self.fileInfo(path, with_hash=False)
+        if info["size"] == entry["size"] and info["mtime_ns"] == entry["mtime_ns"]:
+            return dict(entry)
+        # mtime 變了但內容可能一樣 (複製、touch)，比對 hash
+        if info["size"] == entry["size"] and self.fileHash(path) == entry["sha1"]:
+            return dict(entry, mtime_ns=info["mtime_ns"])
+        return None
+
+    def getEmbedding(self, row):
+        return np.array(self.embeddings[row], dtype=np.float32)  # 從 memmap 複製出來
+
+    def update(self, entries, embeddings):
+        # 和目前內容不同才重寫
+        with self.lock:
+            if entries != self.entries:
+                self.save(entries, embeddings)
+
+    def save(self, entries, embeddings):
+        # entries: {rel_path: entry}，entry["row"] 對應 embeddings 的列 (rejected 為 -1)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        self.embeddings = None  # 先釋放 memmap (Windows 上被 map 的檔案無法覆蓋)
+
+        tmp_matrix = self.matrix_path.with_suffix(".tmp.npy")
+        np.save(tmp_matrix, embeddings)
+        os.replace(tmp_matrix, self.matrix_path)
+
+        tmp_meta = self.meta_path.with_suffix(".tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_meta, self.meta_path)
+
+        self.entries = entries
+        self.embeddings = np.load(self.matrix_path, mmap_mode="r")
+        print(f"[特徵快取] 已儲存 {len(entries)} 筆記錄，{embeddings.shape[0]} 個特徵")
+
+    def saveIndex(self, face_index, config):
+        # 索引的 id 必須等於 embeddings.npy 的 row，記下索引設定和當時 meta.json 的 hash
+        tmp_index = self.index_path.with_suffix(".tmp")
+        face_index.save(tmp_index)
+        os.replace(tmp_index, self.index_path)
+
+        tmp_meta = self.index_meta_path.with_suffix(".tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "meta_sha1": self.fileHash(self.meta_path), "faces": face_index.ntotal}, f)
+        os.replace(tmp_meta, self.index_meta_path)
+        print(f"[特徵快取] 已儲存索引 ({face_index.ntotal} 個人臉) {self.index_path}")
+
+    def loadIndex(self, face_index, config):
+        # 索引設定相同、meta.json 沒變過 (熱更新 / 自我學習之後會變) 才載入，否則回傳 False 由呼叫端重建
+        if not self.index_path.exists() or not self.index_meta_path.exists() or not self.meta_path.exists():
+            return False
+        try:
+            with open(self.index_meta_path, "r", encoding="utf-8") as f:
+                index_meta = json.load(f)
+            if index_meta["config"] != config or index_meta["meta_sha1"] != self.fileHash(self.meta_path):
+                return False
+            face_index.load(self.index_path)
+            print(f"[特徵快取] 已載入索引 ({face_index.ntotal} 個人臉) {self.index_path}")
+            return True
+        except Exception as e:
+            print(f"[特徵快取] 讀取索引失敗，將重新建立: {e}")
+            return False
@@ -0,0 +1,135 @@
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+from Core.FaceRecognition.FaceEmbeddingStore import FaceEmbeddingStore, scanGallery
+from Core.FaceRecognition.FaceIndex import FaceIndex, loadIndexConfig
+
+# 離線建立人臉庫：用多個程序平行讀圖 + 偵測 + 抽特徵，寫出 FaceManager 啟動時載入的特徵快取 (meta.json / embeddings.npy) 和索引檔 (index.faiss)
+# 執行: python -m Core.FaceRecognition.FaceEnrollment [--workers 4] [--rebuild]
+# 不 import FaceManager (import 時就會載入模型和人臉庫)，每個子程序自己載入偵測 + 辨識模型
+load_dotenv()
+CUR_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+face_app = None  # 子程序各自的 FaceAnalysis
+
+
+def initWorker(model_name, ctx_id, det_size):
+    global face_app
+    import insightface  # 只有子程序需要
+    cv2.setNumThreads(1)  # 平行度由程序數決定
+    face_app = insightface.app.FaceAnalysis(name=model_name, allowed_modules=["detection", "recognition"])
+    face_app.prepare(ctx_id=ctx_id, det_size=det_size)
+
+
+def embedFile(task):
+    # 回傳 (rel_path, name, file_info, embedding, 拒絕原因)，剛好一張臉才有 embedding
+    # 單張圖片出錯 (沒有權限 / 模型錯誤) 也當成拒絕回傳，不中斷整個建庫
+    rel_path, name, img_path = task
+    info = None
+    try:
+        info = FaceEmbeddingStore.fileInfo(img_path)
+        img = cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return rel_path, name, info, None, "無法讀取圖片"
+        faces = face_app.get(img)
+        if len(faces) != 1:
+            return rel_path, name, info, None, f"找到 {len(faces)} 張臉"
+        return rel_path, name, info, faces[0].normed_embedding.astype(np.float32), None
+    except Exception as e:
+        return rel_path, name, info, None, f"讀取時發生問題：{e}"
+
+
+class FaceEnrollment:
+    def __init__(self, known_path, store_path, workers=None, ctx_id=-1, det_size=(320, 320), model_name="buffalo_l", chunksize=4):
+        self.known_path = known_path
+        self.store = FaceEmbeddingStore(store_path)
+        self.workers = workers or os.cpu_count() or 1
+        self.ctx_id = ctx_id  # 多程序預設用 CPU，GPU 上一個程序通常就夠
+        self.det_size = det_size
+        self.model_name = model_name
+        self.chunksize = chunksize
+        self.index_config = loadIndexConfig()
+
+    def run(self, rebuild=False):
+        start = time.perf_counter()
+        files = scanGallery(self.known_path)
+
+        # 沒變的圖片直接沿用快取的特徵，--rebuild 全部重抽
+        results = {}  # {rel_path: (entry, embedding)}
+        todo = []
+        for rel_path, (name, img_path) in files.items():
+            entry = None if rebuild else self.store.lookup(rel_path, img_path)
+            if entry is not None and entry["name"] == name:
+                results[rel_path] = (entry, self.store.getEmbedding(entry["row"]) if entry["row"] >= 0 else None)
+            else:
+                todo.append((rel_path, name, str(img_path)))
+        print(f"[建庫] {len(files)} 張圖片，快取命中 {len(results)} 張，需要抽特徵 {len(todo)} 張 ({self.workers} 個程序)")
+
+        rejected = 0
+        embed_start = time.perf_counter()
+        if todo:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker,
+                                     initargs=(self.model_name, self.ctx_id, self.det_size)) as executor:
+                for done, (rel_path, name, info, embedding, reason) in enumerate(executor.map(embedFile, todo, chunksize=self.chunksize), 1):
+                    if embedding is None:
+                        rejected += 1
+                        print(f"[拒絕] {rel_path}: {reason}")
+                    if info is None:
+                        continue  # 連檔案資訊都讀不到，不記錄 (下次重新嘗試)
+                    results[rel_path] = ({"name": name, **info}, embedding)
+                    if done % 100 == 0:
+                        print(f"[建庫] {done}/{len(todo)} ({done / (time.perf_counter() - embed_start):.1f} 張/秒)")
+        embed_time = time.perf_counter() - embed_start
+
+        # 依掃描順序編 row，row 就是 FaceManager 的 id (索引檔才能直接沿用)
+        entries = {}
+        embeddings = []
+        for rel_path in files:
+            if rel_path not in results:
+                continue
+            entry, embedding = results[rel_path]
+            entry["row"] = -1 if embedding is None else len(embeddings)
+            if embedding is not None:
+                embeddings.append(embedding)
+            entries[rel_path] = entry
+        matrix = np.array(embeddings, dtype=np.float32).reshape(-1, 512)
+        if rebuild:
+            self.store.save(entries, matrix)  # 檔案沒變 entries 也會一樣，但特徵是重抽的 (例如換了 --det-size)，一定要寫入
+        else:
+            self.store.update(entries, matrix)
+
+        index_start = time.perf_counter()
+        face_index = FaceIndex(512, **self.index_config)
+        face_index.build(matrix)
+        self.store.saveIndex(face_index, self.index_config)
+        index_time = time.perf_counter() - index_start
+
+        total = time.perf_counter() - start
+        print(f"[建庫] 完成：{len(entries)} 張圖片，{matrix.shape[0]} 個人臉，拒絕 {len(entries) - matrix.shape[0]} 張 (本次抽特徵拒絕 {rejected} 張)")
+        if todo:
+            print(f"[建庫] 抽特徵 {len(todo)} 張 {embed_time:.1f}s ({len(todo) / embed_time:.1f} 張/秒)")
+        print(f"[建庫] 索引 ({face_index.index_type}, {face_index.storage}) {index_time:.1f}s，總計 {total:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="平行建立 KnownFaces 特徵快取與 FAISS 索引檔")
+    parser.add_argument("--known", default=os.path.join(CUR_FILE_PATH, "KnownFaces"), help="KnownFaces 資料夾 (KnownFaces/<人名>/<圖片>)")
+    parser.add_argument("--store", default=os.getenv("FACE_EMBEDDING_STORE", os.path.join(CUR_FILE_PATH, "KnownFacesStore")), help="特徵快取資料夾")
+    parser.add_argument("--workers", type=int, default=0, help="程序數，0 = CPU 核心數")
+    parser.add_argument("--ctx-id", type=int, default=-1, help="-1: CPU, 0: GPU")
+    parser.add_argument("--det-size", type=int, default=320)
+    parser.add_argument("--chunksize", type=int, default=4, help="每次分給子程序的圖片數")
+    parser.add_argument("--rebuild", action="store_true", help="忽略快取，全部重新抽特徵")
+    args = parser.parse_args()
+
+    FaceEnrollment(args.known, args.store, workers=args.workers, ctx_id=args.ctx_id,
+                   det_size=(args.det_size, args.det_size), chunksize=args.chunksize).run(rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+# 偵測之間用稀疏光流 (Lucas-Kanade) 推算人臉位置：每 detect_interval 幀才跑一次偵測器，
+# 中間幀追蹤上次偵測到的 5 點 landmark + 臉框內的格點，用中位數位移 / 縮放移動臉框 (median flow)
+# 正反向各追一次，來回誤差太大的點不算；任何一張臉可信的點不夠就放棄推算，這一幀改跑偵測
+class FaceFlowTracker:
+    def __init__(self, detect_interval=3, grid=3, max_fb_error=1.0, min_good_ratio=0.5, score_decay=0.95):
+        self.detect_interval = detect_interval  # 每幾幀偵測一次，1 = 每幀偵測 (不推算)
+        self.grid = grid  # 臉框內取 grid x grid 個點 (加上 landmark 一起追)
+        self.max_fb_error = max_fb_error  # 正反向追蹤回到原處的誤差上限 (px)
+        self.min_good_ratio = min_good_ratio  # 每張臉至少這個比例的點可信，否則改跑偵測
+        self.score_decay = score_decay  # 推算出來的臉每幀分數打折，越久沒偵測越不可信
+        self.lk_params = dict(winSize=(15, 15), maxLevel=2,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.pre_gray = None
+        self.faces = []
+        self.frames_since_detect = 0
+        self.stats = {"detect": 0, "flow": 0, "fallback": 0}
+
+    def needsDetection(self, gray):
+        return (self.detect_interval <= 1 or self.pre_gray is None or self.pre_gray.shape != gray.shape
+                or self.frames_since_detect + 1 >= self.detect_interval)
+
+    def reset(self, gray, faces):
+        # 偵測完呼叫：之後從這些臉開始推算
+        self.pre_gray = gray
+        self.faces = faces
+        self.frames_since_detect = 0
+        self.stats["detect"] += 1
+
+    def facePoints(self, face):
+        x1, y1, x2, y2 = face.bbox[:4]
+        ratios = (np.arange(self.grid) + 1) / (self.grid + 1) * 0.6 + 0.2  # 臉框中間 60%，避開背景
+        xs, ys = np.meshgrid(x1 + (x2 - x1) * ratios, y1 + (y2 - y1) * ratios)
+        points = np.stack([xs.ravel(), ys.ravel()], axis=1)
+        if face.kps is not None:
+            points = np.vstack([face.kps, points])
+        return points.astype(np.float32)
+
+    def propagate(self, gray):
+        # 回傳推算的臉 (和 detectFaces 相同格式)，有臉推算不可信時回傳 None (要改跑偵測)
+        if not self.faces:
+            self.pre_gray = gray
+            self.frames_since_detect += 1
+            self.stats["flow"] += 1
+            return []
+
+        point_sets = [self.facePoints(face) for face in self.faces]
+        p0 = np.concatenate(point_sets).reshape(-1, 1, 2)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(self.pre_gray, gray, p0, None, **self.lk_params)
+        p0r, status_r, _ = cv2.calcOpticalFlowPyrLK(gray, self.pre_gray, p1, None, **self.lk_params)
+        fb_error = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (status_r.ravel() == 1) & (fb_error < self.max_fb_error)
+        p0, p1 = p0.reshape(-1, 2), p1.reshape(-1, 2)
+
+        faces = []
+        start = 0
+        for face, points in zip(self.faces, point_sets):
+            end = start + len(points)
+            mask = good[start:end]
+            if mask.sum() < max(2, len(points) * self.min_good_ratio):
+                self.stats["fallback"] += 1
+                return None
+            src, dst = p0[start:end][mask], p1[start:end][mask]
+            start = end
+
+            # 位移取中位數；縮放取兩兩點距離比的中位數
+            shift = np.median(dst - src, axis=0)
+            i, j = np.triu_indices(len(src), k=1)
+            src_dist = np.linalg.norm(src[i] - src[j], axis=1)
+            valid = src_dist > 1e-3
+            scale = float(np.median(np.linalg.norm(dst[i] - dst[j], axis=1)[valid] / src_dist[valid])) if valid.any() else 1.0
+
+            center = (face.bbox[:2] + face.bbox[2:4]) / 2
+            new_center = center + shift
+            bbox = np.concatenate([new_center - (center - face.bbox[:2]) * scale,
+                                   new_center + (face.bbox[2:4] - center) * scale]).astype(np.float32)
+            kps = None if face.kps is None else ((face.kps - center) * scale + new_center).astype(np.float32)
+            faces.append(Face(bbox=bbox, kps=kps, det_score=face.det_score * self.score_decay))
+
+        self.pre_gray = gray
+        self.faces = faces
+        self.frames_since_detect += 1
+        self.stats["flow"] += 1
+        return faces
+
+    def getStats(self):
+        return dict(self.stats)
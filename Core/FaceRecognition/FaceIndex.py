@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import faiss
+
+# flat: 暴力搜尋 (小型人臉庫)，ivf / hnsw: 近似搜尋 (上萬人)
+FACE_INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+# 向量在索引內的儲存方式 (每張臉)：flat = float32 2 KB, fp16 = 1 KB, sq8 = 512 B, pq = pq_m bytes
+FACE_INDEX_STORAGES = ("flat", "fp16", "sq8", "pq")
+
+
+def loadIndexConfig():
+    # .env 的 FACE_INDEX_* 設定 (FaceIndex 的參數)，距離統一為 L2²
+    return {
+        "index_type": os.getenv("FACE_INDEX_TYPE", "flat").lower(),
+        "top_k": int(os.getenv("FACE_INDEX_TOPK", 5)),
+        "nlist": int(os.getenv("FACE_INDEX_NLIST", 0)),
+        "nprobe": int(os.getenv("FACE_INDEX_NPROBE", 8)),
+        "hnsw_m": int(os.getenv("FACE_INDEX_HNSW_M", 32)),
+        "ef_search": int(os.getenv("FACE_INDEX_EF_SEARCH", 64)),
+        "storage": os.getenv("FACE_INDEX_STORAGE", "flat").lower(),
+        "pq_m": int(os.getenv("FACE_INDEX_PQ_M", 64)),
+    }
+
+
+# normed_embedding 的 inner-product 索引
+# 對單位向量 L2² = 2 - 2·cos，所以搜尋結果一律換算成 L2² 距離，原本的辨識 / 學習閾值不用改
+# 每個向量帶自己的 id (IDMap / IVF 原生 id)，人臉庫有增減時可以只加 / 刪對應的向量
+class FaceIndex:
+    def __init__(self, dim=512, index_type="flat", top_k=5, nlist=0, nprobe=8, hnsw_m=32, ef_construction=80, ef_search=64,
+                 storage="flat", pq_m=64):
+        if index_type not in FACE_INDEX_TYPES:
+            print(f"[警告] 未知的索引類型: {index_type}，改用 flat")
+            index_type = "flat"
+        if storage not in FACE_INDEX_STORAGES:
+            print(f"[警告] 未知的儲存方式: {storage}，改用 flat")
+            storage = "flat"
+        self.dim = dim
+        self.index_type = index_type
+        self.storage = storage
+        self.pq_m = pq_m  # PQ 子空間數 (每張臉 pq_m bytes)，dim 必須能被整除
+        self.top_k = top_k  # 每個 query 取前 k 個，再依人名投票
+        self.nlist = nlist  # IVF 分群數，0 = 依人臉數自動決定
+        self.nprobe = nprobe  # IVF 搜尋時查看的群數
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = self.createIndex(0)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def memoryBytes(self):
+        return faiss.serialize_index(self.index).nbytes
+
+    def createIndex(self, n):
+        # 訓練樣本不夠時 (PQ 每個子空間要 256 個中心)，先用不需要訓練的 fp16，下次重建再換回來
+        storage = self.storage
+        min_train = {"flat": 0, "fp16": 0, "sq8": 1, "pq": 256 * 39}[storage]
+        if n < min_train:
+            if n > 0:
+                print(f"[索引] 人臉數 {n} 不足以訓練 {storage}，先使用 fp16")
+            storage = "fp16"
+        codes = {"flat": "Flat", "fp16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{self.pq_m}"}[storage]
+
+        if self.index_type == "ivf":
+            nlist = self.nlist or max(1, min(int(4 * np.sqrt(n)), n // 39))  # faiss 建議每一群至少 39 個訓練樣本
+            if n >= nlist * 39:
+                index = faiss.index_factory(self.dim, f"IVF{nlist},{codes}", faiss.METRIC_INNER_PRODUCT)
+                self.applySearchParams(index)
+                return index  # IVF 原生支援 add_with_ids / remove_ids
+            if n > 0:
+                print(f"[索引] 人臉數 {n} 不足以訓練 IVF (nlist={nlist})，先使用 flat")
+        elif self.index_type == "hnsw":
+            index = faiss.index_factory(self.dim, f"IDMap2,HNSW{self.hnsw_m}" + ("" if codes == "Flat" else f"_{codes}"), faiss.METRIC_INNER_PRODUCT)
+            faiss.downcast_index(index.index).hnsw.efConstruction = self.ef_construction
+            self.applySearchParams(index)
+            return index
+        return faiss.index_factory(self.dim, f"IDMap2,{codes}", faiss.METRIC_INNER_PRODUCT)
+
+    def applySearchParams(self, index):
+        # nprobe / efSearch 是搜尋時的參數，建立和從檔案載入後都要設定
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(self.nprobe, ivf.nlist)
+        elif self.index_type == "hnsw":
+            faiss.downcast_index(index.index).hnsw.efSearch = self.ef_search
+
+    def save(self, path):
+        faiss.write_index(self.index, str(path))
+
+    def load(self, path):
+        index = faiss.read_index(str(path))
+        if index.d != self.dim:
+            raise ValueError(f"索引維度 {index.d} 與 {self.dim} 不符")
+        self.applySearchParams(index)
+        self.index = index
+
+    def build(self, embeddings, ids=None):
+        # 依目前的人臉建立 (並訓練) 新索引，ids 預設為 0..n-1
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.arange(embeddings.shape[0], dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        index = self.createIndex(embeddings.shape[0])
+        if not index.is_trained:
+            index.train(embeddings)
+        if embeddings.shape[0] > 0:
+            index.add_with_ids(embeddings, ids)
+        self.index = index
+
+    def add(self, embeddings, ids):
+        self.index.add_with_ids(np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dim),
+                                np.asarray(ids, dtype=np.int64))
+
+    def remove(self, ids):
+        # 回傳是否真的刪除；HNSW 不支援刪除，向量會留在索引裡，搜尋時由呼叫端用名稱表過濾掉
+        try:
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+            return True
+        except RuntimeError:
+            return False
+
+    def search(self, queries, k=1):
+        # 回傳 (D, I)，D 為 L2² 距離 (沒有結果的位置為 inf，I 為 -1)
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self.index.ntotal == 0:
+            return (np.full((queries.shape[0], k), np.inf, dtype=np.float32),
+                    np.full((queries.shape[0], k), -1, dtype=np.int64))
+        S, I = self.index.search(queries, k)
+        D = np.where(I >= 0, 2.0 - 2.0 * S, np.inf).astype(np.float32)
+        return D, I
+
+    def searchByPerson(self, queries, names):
+        # top-k 後依人名投票：相似度 (cos, 負值不計) 加總最高的人勝出，回傳該人最近的 (距離, id)
+        # names: {id: name}，不在 names 裡的 id (已刪除) 略過
+        D, I = self.search(queries, self.top_k)
+        best_D = np.full(D.shape[0], np.inf, dtype=np.float32)
+        best_I = np.full(D.shape[0], -1, dtype=np.int64)
+        for q in range(D.shape[0]):
+            votes = {}  # {name: [score, best_distance, best_index]}
+            for distance, idx in zip(D[q], I[q]):
+                name = names.get(int(idx)) if idx >= 0 else None
+                if name is None:
+                    continue
+                vote = votes.setdefault(name, [0.0, np.inf, -1])
+                vote[0] += max(1.0 - distance / 2.0, 0.0)
+                if distance < vote[1]:
+                    vote[1], vote[2] = distance, idx
+            if votes:
+                _, best_D[q], best_I[q] = max(votes.values(), key=lambda v: (v[0], -v[1]))
+        return best_D, best_I
@@ -0,0 +1,57 @@
+import threading
+from multiprocessing.connection import Client
+
+def parseAddress(address):
+    # "host:port" -> TCP (localhost)，其他視為 Unix socket 路徑 (Windows 可用 \\.\pipe\名稱)
+    if ":" in address and not address.startswith(("/", "\\\\")):
+        host, port = address.rsplit(":", 1)
+        return (host or "localhost", int(port))
+    return address
+
+
+# 共用人臉索引服務 (Server/FaceIndexServer.py) 的 client
+# 多個攝影機程序共用同一份人臉庫 / 索引，一個程序自我學習，其他程序馬上查得到
+class FaceIndexClient:
+    def __init__(self, address, authkey):
+        if not authkey:
+            raise ValueError("連線人臉索引服務需要 authkey (FACE_INDEX_AUTHKEY)")
+        self.address = parseAddress(address)
+        self.authkey = authkey
+        self.conn = None
+        self.lock = threading.Lock()  # Connection 不是 thread-safe，一次只送一個請求
+
+    def request(self, message):
+        with self.lock:
+            for attempt in range(2):  # 斷線時重連一次
+                try:
+                    if self.conn is None:
+                        self.conn = Client(self.address, authkey=self.authkey)
+                    self.conn.send(message)
+                    response = self.conn.recv()
+                    break
+                except (OSError, EOFError) as e:
+                    self.close()
+                    if attempt == 1:
+                        raise ConnectionError(f"無法連線到人臉索引服務 {self.address}: {e}")
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def search(self, embeddings):
+        # 回傳 (distances, candidate_names)，沒有結果的 name 為 None
+        response = self.request({"op": "search", "embeddings": embeddings})
+        return response["distances"], response["names"]
+
+    def add(self, name, embedding, img_path=None):
+        self.request({"op": "add", "name": name, "embedding": embedding, "img_path": img_path})
+
+    def info(self):
+        return self.request({"op": "info"})
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
@@ -1,14 +1,40 @@
 import os
+import time
 import threading
 import cv2
 import numpy as np
 from pathlib import Path
 import insightface
-import faiss
+from insightface.app.common import Face
+from insightface.utils import face_align
 from PIL import ImageFont
+from dotenv import load_dotenv
+load_dotenv()
 
 from Manager.LineAlarmManager import LineAlarmManager
 from Core.FaceRecognition.FaceSelfLearning import FaceSelfLearning
+from Core.FaceRecognition.FaceEmbeddingStore import FaceEmbeddingStore, scanGallery
+from Core.FaceRecognition.FaceIndex import FaceIndex, loadIndexConfig
+from Core.FaceRecognition.FaceIndexClient import FaceIndexClient
+from Core.FaceRecognition.FaceRecognitionWorker import FaceRecognitionWorker
+from Core.FaceRecognition.FaceQuality import FaceQuality
+from Core.FaceRecognition.RecognitionScheduler import RecognitionScheduler
+from Core.FaceRecognition.UnknownFaceCache import UnknownFaceCache
+from Core.FaceRecognition.FaceRegions import prepareRegions, packRegions, buildMosaic
+from Core.FaceRecognition.DetSizeSelector import DetSizeSelector
+
+# insightface 要載入的模組；lean 只載入偵測 + 辨識 (genderage / 2D, 3D landmark 我們從來不讀)
+FACE_MODEL_PROFILES = {
+    "lean": ["detection", "recognition"],
+    "full": None,  # None = buffalo_l 的全部模組
+}
+
+PENDING_NAME = "Pending"  # 已送出辨識、還沒有結果
+
+
+def isIdentified(name):
+    # 辨識出已知人物 (不是 Unknown / Pending / 學習中)
+    return name not in ("Unknown", PENDING_NAME) and "學習中" not in name
 
 
 # 需要和 KnownFaces 資料夾放在一起 (更改 self.known_dir)
@@ -18,92 +44,621 @@ class FaceManager:
         self.CurFilePath = os.path.dirname(os.path.abspath(__file__))
         self.known_path = Path(os.path.join(self.CurFilePath, self.known_dir)).resolve()
 
-        self.face_app = insightface.app.FaceAnalysis(name="buffalo_l")
-        self.face_app.prepare(ctx_id=0, det_size=(320, 320))  # ctx_id=0: GPU, -1: CPU
-        self.faiss_index = faiss.IndexFlatL2(512)  # L2 距離度量
-        self.known_embeddings = []
-        self.known_names = []
+        self.model_name = "buffalo_l"
+        self.model_profile = os.getenv("FACE_MODEL_PROFILE", "lean").lower()
+        self.ctx_id = 0  # ctx_id=0: GPU, -1: CPU
+        self.det_size = (320, 320)  # prepare 用的大小，每次偵測的大小由 detSizeSelector 決定
+        self.detSizeSelector = DetSizeSelector(sizes=[int(size) for size in os.getenv("FACE_DET_SIZES", "160,320,480,640").split(",")],
+                                               default_size=self.det_size[0])
+        # 只在候選區域 (動靜 / 人物框 / 上一幀的人臉) 找臉
+        self.region_padding = 0.25  # 區域每邊外擴的比例
+        self.region_max_coverage = 0.6  # 區域總面積超過整張圖的這個比例就直接偵測整張
+        self.region_stats = {"frames": 0, "skipped": 0, "full": 0, "mosaic": 0}
+        self.loadFaceModels()
+        self.recognition_model = self.face_app.models["recognition"]  # ArcFace，batch 抽特徵用
+        self.embedding_batch_size = 32
+        # 索引類型：flat (暴力搜尋) / ivf / hnsw (大型人臉庫)，距離統一為 L2²
+        self.index_config = loadIndexConfig()
+        self.faiss_index = FaceIndex(512, **self.index_config)
+        # 特徵只存在索引裡 (依 FACE_INDEX_STORAGE 壓縮) 和磁碟上的特徵快取，不另外保留一份 float32
+        self.pending_embeddings = {}  # {id: np.array}，還沒寫進特徵快取的特徵 (寫入後就釋放)
+        self.known_names = {}  # {id: name}，id 即 FAISS 索引內的 id
+        self.gallery = {}  # {rel_path: {"name", "size", "mtime_ns", "sha1", "id", "row"}}，KnownFaces 每張圖片，id = -1 表示被拒絕，row = 特徵快取的列 (-1 = 尚未寫入)
+        self.store_lock = threading.RLock()  # 特徵快取的讀取 (memmap 列) 和重寫不能交錯
+        self.next_gallery_id = 0
+        self.index_lock = threading.Lock()  # 多支攝影機共用同一個索引 / 名稱表 / gallery，search 和 add / remove 不能同時進行
         self.faceRecognition_threshold = 1.1        # 越小越嚴格 (0.-0.6 常見)
-        self.face_cache = {}  # {track_id: {"name": str, "embedding": np.array}} # 快取已識別的人臉
-        self.loadKnownFaces()
+        self.debug_log = os.getenv("FACE_DEBUG_LOG", "false").lower() in ("true", "1", "yes", "on")  # 每次比對結果都印出來 (每幀都會印)
+        self.face_cache = {}  # {track_key: {"name": str, "embedding": np.array}} # 快取已識別的人臉，track_key = (stream, tracker, id)
+        self.embedding_store = FaceEmbeddingStore(os.getenv("FACE_EMBEDDING_STORE", os.path.join(self.CurFilePath, "KnownFacesStore")))
+
+        # 陌生人去重：同一個陌生人換了 track_id (離開再回來 / 追蹤斷掉) 時沿用之前的身分、搜尋結果和告警狀態 (人臉庫載入 / 變動時要通知，所以先建立)
+        self.unknownFaces = UnknownFaceCache(ttl=float(os.getenv("FACE_UNKNOWN_TTL", 60)),
+                                             threshold=float(os.getenv("FACE_UNKNOWN_THRESHOLD", 0.8)))
+
+        # 有設定共用人臉索引服務 (Server/FaceIndexServer.py) 就不在本程序載入人臉庫，搜尋 / 新增都交給服務
+        self.index_server = os.getenv("FACE_INDEX_SERVER", "")
+        self.index_client = None
+        if self.index_server:
+            self.index_client = FaceIndexClient(self.index_server, os.getenv("FACE_INDEX_AUTHKEY", "").encode())
+            print(f"[索引] 使用共用人臉索引服務: {self.index_server}")
+        else:
+            self.loadKnownFaces()
+
+        # 自我學習在辨識路徑上 (持有 result_lock)，學到的特徵不在那裡重寫特徵快取：標記後由背景執行緒等一下再合併寫入
+        # 還沒寫入就關閉也沒關係，學到的圖片已經存進 KnownFaces，下次啟動會重新抽特徵
+        self.store_flush_delay = 2.0  # 秒，這段時間內學到的臉一起寫
+        self.store_dirty = threading.Event()
+        if self.index_client is None:
+            threading.Thread(target=self.flushEmbeddingStore, name="EmbeddingStoreWriter", daemon=True).start()
+
+        # KnownFaces 熱更新：背景執行緒定期比對檔案 mtime，只加 / 刪有變動的圖片 (0 = 不監看)
+        self.gallery_reload_interval = float(os.getenv("FACE_GALLERY_RELOAD_INTERVAL", 5))
+        if self.gallery_reload_interval > 0 and self.index_client is None:
+            threading.Thread(target=self.watchGallery, name="GalleryWatcher", daemon=True).start()
 
         # 自我學習機制相關變數 (只有先做追中才能使用自我學習)
         self.faceSelfLearning = FaceSelfLearning(self.known_path)
         self.learning_threshold = 2.0  # 最大距離閾值
 
+        # 品質門檻：太小 / 太糊 / 側臉不抽特徵，每個 track 留下品質最好的一張 crop
+        self.faceQuality = FaceQuality()
+        self.quality_improve_ratio = 1.1  # 分數要比之前最好的高 10% 才算更好
+        self.best_shots = {}  # {track_key: {"quality": dict, "crop": np.array, "embedding": np.array}}，最好的一張留給告警 / 自我學習
+        self.quality_stats = {"rejected": 0, "accepted": 0}
+        self.recognitionScheduler = RecognitionScheduler()  # Unknown 的 track 重試間隔指數退避
+
+        # 每個 track 的特徵以品質加權平均 (舊的樣本逐次衰減)，再正規化後拿去搜尋；平均變化不夠大就沿用上次結果
+        self.track_embeddings = {}  # {track_key: {"sum": np.array, "searched": np.array}}
+        self.embedding_decay = 0.9
+        self.aggregate_min_change = 0.05  # L2² 距離 (= 2 - 2·cos)
+        self.aggregate_stats = {"searched": 0, "skipped": 0}
+
+        # 非同步辨識：抽特徵 + 搜尋交給 worker，camera thread 不用等
+        # result_lock 保護 face_cache / learning_cache，worker 寫回結果和 track 結束清除時都要持有
+        self.result_lock = threading.Lock()
+        self.async_recognition = os.getenv("FACE_RECOGNITION_ASYNC", "true").lower() in ("true", "1", "yes", "on")
+        self.worker = None
+        if self.async_recognition:
+            self.worker = FaceRecognitionWorker(self,
+                                                workers=int(os.getenv("FACE_RECOGNITION_WORKERS", 1)),
+                                                queue_size=int(os.getenv("FACE_RECOGNITION_QUEUE_SIZE", 64)),
+                                                batch_size=self.embedding_batch_size)
+
+    def loadFaceModels(self):
+        if self.model_profile not in FACE_MODEL_PROFILES:
+            print(f"[警告] 未知的 FACE_MODEL_PROFILE: {self.model_profile}，改用 lean")
+            self.model_profile = "lean"
+
+        start = time.perf_counter()
+        self.face_app = insightface.app.FaceAnalysis(name=self.model_name, allowed_modules=FACE_MODEL_PROFILES[self.model_profile])
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.face_app.prepare(ctx_id=self.ctx_id, det_size=self.det_size)
+        prepare_time = time.perf_counter() - start
+        print(f"[模型] {self.model_name} ({self.model_profile}) 載入 {load_time:.2f}s, prepare {prepare_time:.2f}s, 模組: {', '.join(self.face_app.models.keys())}")
+
+        # 每個模組用假資料跑一次 (warm-up)，順便回報單次延遲
+        dummy = np.zeros((self.det_size[1], self.det_size[0], 3), dtype=np.uint8)
+        dummy_face = Face(bbox=np.array([8, 8, 104, 104], dtype=np.float32),
+                          kps=np.array([[38, 52], [74, 52], [56, 72], [42, 92], [70, 92]], dtype=np.float32),
+                          det_score=1.0)
+        for taskname, model in self.face_app.models.items():
+            start = time.perf_counter()
+            try:
+                if taskname == "detection":
+                    for size in self.detSizeSelector.sizes:  # 每個偵測大小各跑一次 (第一次遇到新的輸入大小比較慢)
+                        model.detect(dummy, input_size=(size, size), max_num=0, metric="default")
+                else:
+                    model.get(dummy, dummy_face)
+                print(f"[模型] {taskname}: {(time.perf_counter() - start) * 1000:.1f} ms")
+            except Exception as e:
+                print(f"[模型] {taskname} warm-up 失敗: {e}")
+
+    def embedImageFile(self, img_path):
+        # 讀圖 + 偵測 + 抽特徵，剛好一張臉才回傳 embedding，否則回傳 None (拒絕)
+        # img = cv2.imread(str(img_path))
+        img = cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"[錯誤] 無法讀取圖片: {img_path}")
+            return None
+        faces = self.face_app.get(img)
+        if len(faces) != 1:
+            print(f"[警告] {img_path} 找到 {len(faces)} 張臉，跳過")
+            return None
+        return faces[0].normed_embedding.astype(np.float32)
+
+    def scanGallery(self):
+        # 只列出檔案 {rel_path: (name, path)}，不讀圖
+        return scanGallery(self.known_path)
+
+    def loadGalleryEntry(self, rel_path, name, img_path):
+        # 回傳 (entry, embedding, cached)，embedding 為 None 表示被拒絕
+        # 檔案沒變就直接用快取的特徵 (或快取的拒絕結果)，不用再跑偵測 + 抽特徵
+        with self.store_lock:
+            entry = self.embedding_store.lookup(rel_path, img_path)
+            if entry is not None and entry["name"] == name:
+                embedding = self.embedding_store.getEmbedding(entry["row"]) if entry["row"] >= 0 else None
+                return entry, embedding, True
+        embedding = self.embedImageFile(img_path)
+        entry = {"name": name, **self.embedding_store.fileInfo(img_path), "row": -1}
+        if embedding is not None:
+            print(f"已載入 {img_path} -> {name}")
+        return entry, embedding, False
+
     def loadKnownFaces(self):
         print(f"載入已知人臉資料夾: {self.known_path}")
-        self.known_embeddings = []
-        self.known_names = []
-        for person_dir in self.known_path.iterdir():
-            if not person_dir.is_dir():
+        embeddings = {}  # 只在建索引時使用
+        pending_embeddings = {}
+        known_names = {}
+        gallery = {}
+        next_id = self.next_gallery_id
+        hits, embedded, rejected = 0, 0, 0
+        for rel_path, (name, img_path) in self.scanGallery().items():
+            try:
+                entry, embedding, cached = self.loadGalleryEntry(rel_path, name, img_path)
+            except Exception as e:
+                print(f"[錯誤] 讀取 {img_path} 時發生問題：{e}")
                 continue
-            name = person_dir.name
-            for img_path in person_dir.glob("*"):
+
+            if cached:
+                hits += 1
+            else:
+                embedded += 1
+            if embedding is None:
+                rejected += 1
+                entry["id"] = -1
+            else:
+                entry["id"] = next_id
+                embeddings[next_id] = embedding
+                if not cached:
+                    pending_embeddings[next_id] = embedding
+                known_names[next_id] = name
+                next_id += 1
+            gallery[rel_path] = entry
+        print(f"[特徵快取] 命中 {hits} 張，重新抽特徵 {embedded} 張，拒絕 {rejected} 張")
+
+        # 建立 FAISS 索引 (在鎖外建好，再和名稱表一起替換)
+        # 全部命中快取、id 和快取的 row 一致時，直接載入之前存的索引檔 (FaceEnrollment 或上次啟動建好的)
+        faiss_index = FaceIndex(512, **self.index_config)
+        loaded = (embedded == 0 and self.rowsMatchIds(gallery)
+                  and {rel_path: {k: v for k, v in entry.items() if k != "id"} for rel_path, entry in gallery.items()} == self.embedding_store.entries
+                  and self.embedding_store.loadIndex(faiss_index, self.index_config))
+        if not loaded:
+            faiss_index.build(np.array(list(embeddings.values()), dtype=np.float32), list(embeddings.keys()))
+        del embeddings
+        with self.index_lock:
+            self.faiss_index = faiss_index
+            self.pending_embeddings = pending_embeddings
+            self.known_names = known_names
+            self.gallery = gallery
+            self.next_gallery_id = next_id
+        self.unknownFaces.invalidate()  # 整個人臉庫重新載入
+        print(f"[完成] 已建立 FAISS 索引 ({faiss_index.index_type}, {faiss_index.storage})，共 {len(known_names)} 個人臉，"
+              f"索引 {faiss_index.memoryBytes() / 1024 / 1024:.1f} MB")
+        self.saveEmbeddingStore()
+        if not loaded:
+            with self.index_lock:
+                if self.rowsMatchIds(self.gallery):
+                    try:
+                        self.embedding_store.saveIndex(self.faiss_index, self.index_config)
+                    except Exception as e:
+                        print(f"[特徵快取] 儲存索引失敗: {e}")
+
+    @staticmethod
+    def rowsMatchIds(gallery):
+        # 索引檔的 id 就是特徵快取的 row，兩者一致時索引檔才能直接沿用
+        return all(entry["row"] == entry["id"] for entry in gallery.values() if entry["id"] >= 0)
+
+    def saveEmbeddingStore(self):
+        # 把目前的 gallery 寫回特徵快取 (有新增 / 變更 / 刪除才會真的寫檔)
+        # 已寫入的特徵從舊的快取檔 (memmap) 讀，新的從 pending_embeddings 讀，寫完後釋放 pending
+        with self.store_lock:
+            with self.index_lock:
+                gallery = {rel_path: dict(entry) for rel_path, entry in self.gallery.items()}
+                pending_embeddings = dict(self.pending_embeddings)
+            entries = {}
+            sources = []  # [(rel_path, id, 舊的 row)]，依新 row 的順序
+            for rel_path, entry in gallery.items():
+                gallery_id, old_row = entry.pop("id"), entry.pop("row")
+                entry["row"] = -1 if gallery_id < 0 else len(sources)
+                if gallery_id >= 0:
+                    sources.append((rel_path, gallery_id, old_row))
+                entries[rel_path] = entry
+
+            if entries != self.embedding_store.entries:
+                matrix = np.empty((len(sources), 512), dtype=np.float32)
+                for row, (_, gallery_id, old_row) in enumerate(sources):
+                    matrix[row] = pending_embeddings[gallery_id] if gallery_id in pending_embeddings else self.embedding_store.getEmbedding(old_row)
                 try:
-                    # img = cv2.imread(str(img_path))
-                    img = cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-                    if img is None:
-                        print(f"[錯誤] 無法讀取圖片: {img_path}")
-                        continue
-                    faces = self.face_app.get(img)
-                    if len(faces) != 1:
-                        print(f"[警告] {img_path} 找到 {len(faces)} 張臉，跳過")
-                        continue
-                    embedding = faces[0].normed_embedding.astype(np.float32)
-                    self.known_embeddings.append(embedding)
-                    self.known_names.append(name)
-                    print(f"已載入 {img_path} -> {name}")
+                    self.embedding_store.update(entries, matrix)
                 except Exception as e:
-                    print(f"[錯誤] 讀取 {img_path} 時發生問題：{e}")
-
-        # 建立 FAISS 索引
-        if len(self.known_embeddings) > 0:
-            self.faiss_index = faiss.IndexFlatL2(512)  # 重新創建
-            self.faiss_index.add(np.array(self.known_embeddings, dtype=np.float32))
-            print(f"[完成] 已建立 FAISS 索引，共 {len(self.known_embeddings)} 個人臉")
-
-
-    def compareFaces(self, small_crop, crop, track_id):
-        # small_crop 是做比較的 (為了加速 resize 過)， crop 是做學習的
-        face = self.face_app.get(small_crop)
-        if len(face) > 0:
-            emb = face[0].normed_embedding.astype('float32')
-            name = "Unknown"
-            if len(self.known_embeddings) > 0:
-                D, I = self.faiss_index.search(np.expand_dims(emb, axis=0), k=1)      # D[0][0] : best_distance & I[0][0] : best_index
-                
-                if I[0][0] < len(self.known_names):
-                    print(f"Track ID {track_id} best match: {self.known_names[I[0][0]]} with distance {D[0][0]:.4f}")
-                    if D[0][0] < self.faceRecognition_threshold:  # 1.1 閾值要自己調，L2距離越小越像
-                        name = self.known_names[I[0][0]]
-                        threading.Thread(target=LineAlarmManager.triggerAlarm, args=(crop.copy(), name)).start() # alarm 傳遞的是全新的 frame，避免被之後的繪畫影響
-                    elif D[0][0] < self.learning_threshold:  # 2.0 在學習範圍內
-                        candidate_name = self.known_names[I[0][0]]
-                        self.faceSelfLearning.learning(self, self.known_dir, track_id, candidate_name, D[0][0], crop)
-                        
-                else:
-                    print(f"[錯誤] 無效的索引 {I[0][0]}，超出已知人臉數量 {len(self.known_names)}。正在重建 FAISS 索引...")
+                    print(f"[特徵快取] 儲存失敗: {e}")
+                    return
+                del matrix
 
-            self.face_cache[track_id] = {"name": name, "embedding": emb}
-            return self.face_cache[track_id]
-        
+            # 已寫入的特徵改指向新的 row，釋放 pending
+            with self.index_lock:
+                for rel_path, gallery_id, _ in sources:
+                    current = self.gallery.get(rel_path)
+                    if current is not None and current["id"] == gallery_id:
+                        current["row"] = entries[rel_path]["row"]
+                    self.pending_embeddings.pop(gallery_id, None)
+
+    def addKnownEmbedding(self, name, embedding, img_path=None):
+        # 自我學習：特徵已經在辨識時算好，直接加進現有索引，不重新掃描 / 重建
+        embedding = np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, 512)
+        if self.index_client is not None:
+            try:
+                self.index_client.add(name, embedding[0], None if img_path is None else str(img_path))
+                self.unknownFaces.invalidate(embedding)
+                print(f"[完成] 已加入 {name} 到共用人臉索引")
+            except Exception as e:
+                print(f"[索引] 新增 {name} 失敗: {e}")
+            return
+        rel_path, entry = None, None
+        if img_path is not None:
+            rel_path = Path(img_path).resolve().relative_to(self.known_path).as_posix()
+            entry = {"name": name, **self.embedding_store.fileInfo(img_path), "row": -1}
+        with self.index_lock:
+            if rel_path is not None and rel_path in self.gallery:
+                return  # 熱更新已經先加進來了
+            gallery_id = self.next_gallery_id
+            self.next_gallery_id += 1
+            self.known_names[gallery_id] = name  # 先加名稱，索引回傳的 id 一定查得到名字
+            if rel_path is not None:
+                self.pending_embeddings[gallery_id] = embedding[0]
+            self.faiss_index.add(embedding, [gallery_id])
+            if rel_path is not None:
+                self.gallery[rel_path] = dict(entry, id=gallery_id)
+        self.unknownFaces.invalidate(embedding)  # 只有比新特徵離得遠的陌生人要重新搜尋
+        print(f"[完成] 已加入 {name} 到 FAISS 索引，共 {len(self.known_names)} 個人臉")
+
+        # 寫進特徵快取 (背景執行緒)，下次啟動不用再抽這張圖
+        if rel_path is not None:
+            self.store_dirty.set()
+
+    def flushEmbeddingStore(self):
+        while True:
+            self.store_dirty.wait()
+            time.sleep(self.store_flush_delay)
+            self.store_dirty.clear()  # 寫入期間又學到的臉會再寫一次
+            try:
+                self.saveEmbeddingStore()
+            except Exception as e:
+                print(f"[特徵快取] 儲存失敗: {e}")
+
+    def reloadGallery(self):
+        # 比對 KnownFaces 和目前的 gallery，只處理新增 / 變更 / 刪除的圖片 (在背景執行緒執行)
+        files = self.scanGallery()
+        with self.index_lock:
+            gallery = dict(self.gallery)
+        changed = []
+        for rel_path, (name, img_path) in files.items():
+            entry = gallery.get(rel_path)
+            if entry is None or entry["name"] != name:
+                changed.append(rel_path)
+                continue
+            stat = os.stat(img_path)
+            if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime_ns"]:
+                changed.append(rel_path)
+        removed = [rel_path for rel_path in gallery if rel_path not in files]
+        if not changed and not removed:
+            return False
+
+        # 讀圖 + 抽特徵在鎖外做，camera thread 的搜尋不會被卡住
+        loaded = {}
+        for rel_path in changed:
+            name, img_path = files[rel_path]
+            try:
+                loaded[rel_path] = self.loadGalleryEntry(rel_path, name, img_path)[:2]
+            except Exception as e:
+                print(f"[錯誤] 讀取 {img_path} 時發生問題：{e}")
+
+        added_count, removed_count, tombstones = 0, 0, False
+        removed_names = set()
+        with self.index_lock:
+            remove_ids = []
+            for rel_path in removed + list(loaded):
+                current = self.gallery.get(rel_path)
+                if rel_path in loaded and current is not None:
+                    new_entry = loaded[rel_path][0]
+                    if (current["size"], current["mtime_ns"]) == (new_entry["size"], new_entry["mtime_ns"]):
+                        del loaded[rel_path]  # 掃描之後才被加進來 (自我學習)，已經是最新的
+                        continue
+                entry = self.gallery.pop(rel_path, None)
+                if entry is not None and entry["id"] >= 0:
+                    remove_ids.append(entry["id"])
+                    removed_names.add(self.known_names.pop(entry["id"], None))
+                    self.pending_embeddings.pop(entry["id"], None)
+            if remove_ids:
+                removed_count = len(remove_ids)
+                tombstones = not self.faiss_index.remove(remove_ids)
+
+            add_ids, add_embeddings = [], []
+            for rel_path, (entry, embedding) in loaded.items():
+                entry["id"] = -1
+                if embedding is not None:
+                    entry["id"] = self.next_gallery_id
+                    self.next_gallery_id += 1
+                    self.known_names[entry["id"]] = entry["name"]
+                    self.pending_embeddings[entry["id"]] = embedding  # 快取的 row 可能在抽特徵期間被重寫過，一律重新寫入
+                    add_ids.append(entry["id"])
+                    add_embeddings.append(embedding)
+                self.gallery[rel_path] = entry
+            if add_ids:
+                added_count = len(add_ids)
+                self.faiss_index.add(np.array(add_embeddings, dtype=np.float32), add_ids)
+        self.unknownFaces.invalidate(np.array(add_embeddings, dtype=np.float32).reshape(-1, 512), removed_names - {None})
+
+        print(f"[熱更新] KnownFaces 新增/更新 {added_count} 張，移除 {removed_count} 張，共 {len(self.known_names)} 個人臉")
+        if tombstones:
+            print(f"[熱更新] {self.faiss_index.index_type} 索引不支援刪除，已移除的人臉在搜尋時略過，重啟後重建")
+        self.saveEmbeddingStore()
+        return True
+
+    def watchGallery(self):
+        while True:
+            time.sleep(self.gallery_reload_interval)
+            try:
+                self.reloadGallery()
+            except Exception as e:
+                print(f"[熱更新] 掃描 KnownFaces 失敗: {e}")
+
+    def detectFaces(self, img, source=None):
+        # 只做偵測 (bbox + 5 點 landmark)，不跑任何 recognition / attribute model
+        # source: 影像來源 (例如 (stream, tracker))，偵測大小依這個來源最近看到的臉大小調整
+        size = self.detSizeSelector.choose(source, img.shape)
+        bboxes, kpss = self.face_app.det_model.detect(img, input_size=(size, size), max_num=0, metric="default")
+        faces = []
+        for i in range(bboxes.shape[0]):
+            kps = kpss[i] if kpss is not None else None
+            faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+        self.detSizeSelector.observe(source, faces)
+        return faces
+
+    def detectFacesInRegions(self, img, regions, source=None):
+        # 只在候選區域內找臉，回傳的 bbox / kps 是 img 的座標 (和 detectFaces 相同)
+        # 所有區域排進同一張拼圖只偵測一次；沒有區域就不偵測，區域幾乎蓋滿整張圖就直接偵測整張
+        boxes = prepareRegions(regions, img.shape, self.region_padding)
+        self.region_stats["frames"] += 1
+        if not boxes:
+            self.region_stats["skipped"] += 1
+            return []
+        if sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in boxes) >= img.shape[0] * img.shape[1] * self.region_max_coverage:
+            self.region_stats["full"] += 1
+            return self.detectFaces(img, source)
+
+        positions, size = packRegions(boxes)
+        faces = []
+        for face in self.detectFaces(buildMosaic(img, boxes, positions, size), source):
+            # 依臉的中心點判斷屬於哪個區域，平移回原圖座標
+            cx, cy = (face.bbox[0] + face.bbox[2]) / 2, (face.bbox[1] + face.bbox[3]) / 2
+            for (x1, y1, x2, y2), (x, y) in zip(boxes, positions):
+                if x <= cx < x + x2 - x1 and y <= cy < y + y2 - y1:
+                    offset = np.array([x1 - x, y1 - y], dtype=np.float32)
+                    faces.append(Face(bbox=face.bbox + np.tile(offset, 2),
+                                      kps=None if face.kps is None else face.kps + offset,
+                                      det_score=face.det_score))
+                    break
+        self.region_stats["mosaic"] += 1
+        return faces
+
+    def alignFaces(self, items):
+        # items: [(img, face)]，依 5 點 landmark 對齊成 ArcFace 的輸入大小 (112x112)
+        image_size = self.recognition_model.input_size[0]
+        return [face_align.norm_crop(img, landmark=face.kps, image_size=image_size) for img, face in items]
+
+    def embedFaces(self, items):
+        # items: [(img, face)]，可以來自不同影像 (甚至不同攝影機)
+        # 全部對齊成 112x112 後疊成一個 batch，只跑一次 ArcFace ONNX
+        return self.embedAligned(self.alignFaces(items))
+
+    def embedAligned(self, aligned):
+        if len(aligned) == 0:
+            return np.empty((0, 512), dtype=np.float32)
+        embeddings = []
+        for start in range(0, len(aligned), self.embedding_batch_size):
+            embeddings.append(self.recognition_model.get_feat(aligned[start:start + self.embedding_batch_size]))
+        embeddings = np.concatenate(embeddings, axis=0).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)  # 等同 Face.normed_embedding
+        return embeddings
+
+    def needsRecognition(self, track_key):
+        # 如果沒有 cache 或是 name 為 Unknown，才需要比對 (已經送出還沒有結果的不重複送)
+        if self.worker is not None and self.worker.isPending(track_key):
+            return False
+        return track_key not in self.face_cache or self.face_cache[track_key]["name"] == "Unknown"
+
+    def submitFaces(self, items):
+        # items: [(track_key, img, face, crop)]，crop 給告警 / 自我學習用
+        # 非同步模式只對齊後送進 worker；同步模式直接 batch 抽特徵 + 搜尋
+        if len(items) == 0:
+            return
+        aligned = self.alignFaces([(img, face) for _, img, face, _ in items])
+
+        # 品質篩選：太差的臉不抽；要不要抽特徵由退避排程決定 (到時間 / 品質大幅提升 / 換了角度)，品質分數會飽和，不能拿「比最好的更好」當條件
+        # 每個 track 記住抽過特徵的臉裡品質最好的一張 (crop + 它自己的特徵)，告警和自我學習都用這張
+        accepted = []
+        for (track_key, _, face, crop), face_img in zip(items, aligned):
+            quality = self.faceQuality.evaluate(face_img, face)
+            if not quality["passed"]:
+                self.quality_stats["rejected"] += 1
+                continue
+            best = self.best_shots.get(track_key)
+            previous = (best, self.recognitionScheduler.schedule.get(track_key))  # 沒送成功時還原
+            # 學習中的 track 需要連續多次比對，不退避
+            if not self.recognitionScheduler.shouldAttempt(track_key, quality, backoff=not self.faceSelfLearning.isLearning(track_key)):
+                continue
+            if best is None or quality["score"] > best["quality"]["score"] * self.quality_improve_ratio:
+                best = self.best_shots[track_key] = {"quality": quality, "crop": crop.copy(), "embedding": None}  # 特徵抽完才填
+            self.quality_stats["accepted"] += 1
+            accepted.append((track_key, face_img, best, quality["score"], previous))
+        if not accepted:
+            return
+
+        if self.worker is not None:
+            for track_key, face_img, best, weight, previous in accepted:
+                if not self.worker.submit(track_key, face_img, best, weight):
+                    self.restoreAttempt(track_key, *previous)
+            return
+        try:
+            embeddings = self.embedAligned([face_img for _, face_img, _, _, _ in accepted])
+        except Exception:
+            for track_key, _, _, _, previous in accepted:
+                self.restoreAttempt(track_key, *previous)
+            raise
+        with self.result_lock:
+            items = [(track_key, best, emb, weight) for (track_key, _, best, weight, _), emb in zip(accepted, embeddings)]
+            self.compareFacesBatch(self.aggregateEmbeddings(items))
+
+    def restoreAttempt(self, track_key, best_shot=None, schedule=None):
+        # 這張臉最後沒有抽到特徵 (佇列滿 / 抽特徵失敗)：還原 best shot (沒有特徵的 best shot 不能拿去學習) 和退避排程，
+        # 下一幀就可以再送，不用等下一個間隔
+        if best_shot is None:
+            self.best_shots.pop(track_key, None)
+        else:
+            self.best_shots[track_key] = best_shot
+        self.recognitionScheduler.restore(track_key, schedule)
+
+    def aggregateEmbeddings(self, items):
+        # items: [(track_key, best_shot, embedding, weight)] -> [(track_key, best crop, 平均特徵, best crop 的特徵)]，只留下需要重新搜尋的
+        # 搜尋用平均特徵；自我學習存的圖片和特徵必須是同一張臉 (之後 --rebuild 重抽才對得上)，所以另外帶 best shot 自己的特徵
+        # 呼叫端需持有 result_lock
+        results = []
+        for track_key, best, emb, weight in items:
+            if best["embedding"] is None:
+                best["embedding"] = emb  # 這張臉就是 best shot
+            state = self.track_embeddings.get(track_key)
+            if state is None:
+                state = self.track_embeddings[track_key] = {"sum": np.zeros_like(emb), "searched": None}
+            state["sum"] = state["sum"] * self.embedding_decay + emb * weight
+            norm = np.linalg.norm(state["sum"])
+            mean = (state["sum"] / norm if norm > 0 else emb).astype(np.float32)
+            # 學習中的 track 每次比對都算一次證據，不能因為平均沒變就跳過
+            if (state["searched"] is not None and track_key in self.face_cache and not self.faceSelfLearning.isLearning(track_key)
+                    and 2.0 - 2.0 * float(mean @ state["searched"]) < self.aggregate_min_change):
+                self.aggregate_stats["skipped"] += 1
+                continue
+            state["searched"] = mean
+            self.aggregate_stats["searched"] += 1
+            results.append((track_key, best["crop"], mean, best["embedding"]))
+        return results
+
+    def matchFace(self, track_key, crop, emb, distance, candidate_name, crop_embedding=None, inherited=False):
+        # 單一張臉的比對結果處理 (告警 / 自我學習 / 快取)，candidate_name 為 None 表示沒有已知人臉
+        # crop_embedding: crop 這張臉自己的特徵 (emb 可能是 track 的平均)，自我學習加進人臉庫的是它
+        # inherited: 距離 / 候選人是沿用最近的陌生人 (沒有搜尋人臉庫)，不能當成自我學習的證據
+        name = "Unknown"
+        if candidate_name is not None:
+            if self.debug_log:
+                print(f"Track ID {track_key} best match: {candidate_name} with distance {distance:.4f}")
+            if distance < self.faceRecognition_threshold:  # 1.1 閾值要自己調，L2距離越小越像
+                name = candidate_name
+                threading.Thread(target=LineAlarmManager.triggerAlarm, args=(crop.copy(), name)).start() # alarm 傳遞的是全新的 frame，避免被之後的繪畫影響
+            elif distance < self.learning_threshold and not inherited:  # 2.0 在學習範圍內
+                self.faceSelfLearning.learning(self, track_key, candidate_name, distance, crop, emb if crop_embedding is None else crop_embedding)
+
+        if name == "Unknown":
+            self.unknownFaces.remember(track_key, emb, distance, candidate_name)
+        else:
+            self.unknownFaces.forget(track_key)
+        self.face_cache[track_key] = {"name": name, "embedding": emb}
+        return self.face_cache[track_key]
 
-    def recognizeFaces(self, small_crop, crop, track_id):
-        # 如果沒有 cache 或是 name 為 Unknown，才進行比對
-        if track_id not in self.face_cache or self.face_cache[track_id]["name"] == "Unknown":
-            
-            # 抽特徵 & 比對
-            self.compareFaces(small_crop, crop, track_id)
-            
-        name = self.face_cache.get(track_id, {"name": "Unknown"})["name"]
+    def compareFacesBatch(self, items):
+        # items: [(track_key, crop, embedding, crop_embedding)]，n 張臉只做一次 FAISS search (n 個 query)
+        if len(items) == 0:
+            return []
+        embs = np.ascontiguousarray(np.stack([item[2] for item in items]), dtype=np.float32)
+
+        # 新 track 和最近的陌生人夠像就沿用他的搜尋結果，其餘的才搜尋人臉庫
+        unknown_ids = self.unknownFaces.match([item[0] for item in items], embs)
+        D = np.full(len(items), np.inf, dtype=np.float32)
+        candidates = [None] * len(items)
+        search = [i for i, unknown_id in enumerate(unknown_ids) if unknown_id is None]
+        if search:
+            search_D, search_candidates = self.searchKnownFaces(embs[search])
+            for j, i in enumerate(search):
+                D[i], candidates[i] = search_D[j], search_candidates[j]
+        for i, unknown_id in enumerate(unknown_ids):
+            if unknown_id is not None:
+                entry = self.unknownFaces.get(unknown_id)
+                self.unknownFaces.attach(items[i][0], unknown_id)
+                D[i], candidates[i] = entry["distance"], entry["candidate_name"]
+                if self.debug_log:
+                    print(f"Track ID {items[i][0]} 沿用最近的陌生人 #{unknown_id}")
+        return [self.matchFace(track_key, crop, embs[i], float(D[i]), candidates[i], crop_embedding, inherited=unknown_ids[i] is not None)
+                for i, (track_key, crop, _, crop_embedding) in enumerate(items)]
+
+    def searchKnownFaces(self, embs):
+        # 回傳 (D, candidate_names)：每個 query 投票勝出的人和他最近的距離，沒有結果的 name 為 None
+        if self.index_client is not None:
+            try:
+                return self.index_client.search(embs)
+            except Exception as e:
+                print(f"[索引] 共用人臉索引服務查詢失敗: {e}")
+                return np.full(len(embs), np.inf, dtype=np.float32), [None] * len(embs)
+        with self.index_lock:
+            # top-k + 依人名投票，名稱在鎖內取出，避免索引被替換後對不上
+            D, I = self.faiss_index.searchByPerson(embs, self.known_names)  # D[i] : best_distance & I[i] : best_index
+            candidates = [self.known_names[int(idx)] if idx >= 0 else None for idx in I]
+        return D, candidates
+
+    def getDisplayName(self, track_key):
+        if track_key not in self.face_cache and self.worker is not None and self.worker.isPending(track_key):
+            return PENDING_NAME
+        name = self.face_cache.get(track_key, {"name": "Unknown"})["name"]
         
         # 處理已知為 Unknown 但有 cache 的情況（可能正在學習中）
-        if name == "Unknown" and track_id in self.face_cache:
-            if self.faceSelfLearning.isLearning(track_id):
-                candidate_name = self.faceSelfLearning.getLearningFaceName(track_id)
+        if name == "Unknown" and track_key in self.face_cache:
+            if self.faceSelfLearning.isLearning(track_key):
+                candidate_name = self.faceSelfLearning.getLearningFaceName(track_key)
                 name = f"學習中-{candidate_name}"
 
         return name
+
+    def onTrackEnded(self, track_key):
+        with self.result_lock:
+            if self.worker is not None:
+                self.worker.cancel(track_key)  # 還在佇列裡的請求不再處理
+            self.face_cache.pop(track_key, None)
+            self.best_shots.pop(track_key, None)
+            self.recognitionScheduler.onTrackEnded(track_key)
+            self.track_embeddings.pop(track_key, None)
+            self.faceSelfLearning.onTrackEnded(track_key)
+            self.unknownFaces.onTrackEnded(track_key)
+
+    def claimUnknownAlarm(self, track_key):
+        # 陌生人告警去重 (見 UnknownFaceCache.claimAlarm)：None = 還沒有這個 track 的陌生人身分，True = 已經告警過
+        with self.result_lock:
+            return self.unknownFaces.claimAlarm(track_key)
+
+    # 快照 (SnapshotManager)：只保存識別結果，學習中的 crops 不保存
+    def getState(self):
+        with self.result_lock:
+            return {"face_cache": dict(self.face_cache)}
+
+    def setState(self, state):
+        with self.result_lock:
+            self.face_cache.update(state["face_cache"])
+
+    def getCacheSizes(self):
+        sizes = {
+            "face_cache": len(self.face_cache),
+            "learning_cache": len(self.faceSelfLearning.learning_cache),
+            "best_shots": len(self.best_shots),
+            "quality": dict(self.quality_stats),
+            "recognition_schedule": self.recognitionScheduler.getStats(),
+            "track_embeddings": len(self.track_embeddings),
+            "aggregate": dict(self.aggregate_stats),
+            "unknown_faces": self.unknownFaces.getStats(),
+            "face_regions": dict(self.region_stats),
+            "det_size": self.detSizeSelector.getStats(),
+        }
+        if self.worker is not None:
+            sizes["recognition_worker"] = self.worker.getStats()
+        return sizes
     
 faceMgr = FaceManager() 
@@ -0,0 +1,41 @@
+import cv2
+
+# 每張偵測到的臉算一個便宜的品質分數 (大小、清晰度、偵測分數、左右轉頭角度)
+# 太小 / 太糊 / 側臉直接不抽特徵，其餘只有比該 track 之前最好的一張更好才抽
+class FaceQuality:
+    def __init__(self, min_size=24, min_sharpness=25.0, min_det_score=0.5, max_yaw=0.45,
+                 ref_size=64, ref_sharpness=150.0):
+        self.min_size = min_size  # 偵測框短邊 (偵測用影像上的像素)
+        self.min_sharpness = min_sharpness  # 對齊後 112x112 灰階的 Laplacian 變異數
+        self.min_det_score = min_det_score
+        self.max_yaw = max_yaw  # 鼻子偏離兩眼中點的比例 (0 = 正臉, 約 0.5 = 側臉)
+        self.ref_size = ref_size  # 達到這個大小 / 清晰度就不再加分
+        self.ref_sharpness = ref_sharpness
+
+    @staticmethod
+    def estimateYaw(kps):
+        # kps: 左眼, 右眼, 鼻子, 左嘴角, 右嘴角
+        if kps is None:
+            return 1.0
+        left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+        eye_dist = right_eye[0] - left_eye[0]
+        if eye_dist <= 0:
+            return 1.0
+        return float((nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_dist)
+
+    def evaluate(self, aligned, face):
+        # aligned: 對齊後的臉 (BGR)，face: 偵測結果 (bbox / kps / det_score)
+        x1, y1, x2, y2 = face.bbox[:4]
+        size = float(min(x2 - x1, y2 - y1))
+        gray = cv2.cvtColor(aligned, cv2.COLOR_BGR2GRAY)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        det_score = float(face.det_score)
+        yaw = self.estimateYaw(face.kps)
+
+        passed = (size >= self.min_size and sharpness >= self.min_sharpness
+                  and det_score >= self.min_det_score and abs(yaw) <= self.max_yaw)
+        score = (det_score
+                 * min(size / self.ref_size, 1.0)
+                 * min(sharpness / self.ref_sharpness, 1.0)
+                 * (1.0 - 0.5 * min(abs(yaw) / self.max_yaw, 1.0)))
+        return {"size": size, "sharpness": sharpness, "det_score": det_score, "yaw": yaw, "score": score, "passed": passed}
@@ -3,17 +3,21 @@ import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from Core.FaceRecognition.FaceManager import faceMgr
+from Core.FaceRecognition.FaceFlowTracker import FaceFlowTracker
 from Manager.OCSortManager import OCSortManager
 from Manager.FontManager import fontMgr
 
 # 需要和 Font 資料夾放在一起
 class FaceRecognition:
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, stream=""):
         self.headless = headless
-        self.trackerMgr = OCSortManager()
-        self.face_cache = {}  # {track_id: {"name": str, "embedding": np.array}} # 快取已識別的人臉
+        self.trackerMgr = OCSortManager(stream, "face")
+        self.trackerMgr.addTrackEndListener(faceMgr.onTrackEnded)  # 識別結果快取在 faceMgr.face_cache
         
         self.frame_resize = 0.5    # 為了速度，把影格縮小 
+        self.detect_source = (stream, "face")  # 偵測大小依這支攝影機最近看到的臉調整
+        self.last_face_boxes = []  # 上一幀追蹤中的人臉 (small_frame 座標)，限定區域偵測時一起當候選區域
+        self.flowTracker = FaceFlowTracker(detect_interval=int(os.getenv("FACE_DETECT_INTERVAL", "1")))  # 偵測之間用光流推算人臉
         self.CurFilePath = os.path.dirname(os.path.abspath(__file__))
         
     def getCrop(self, x1, y1, x2, y2, frame, small_frame, frame_resize):
@@ -44,11 +48,23 @@ class FaceRecognition:
         
         return small_crop, crop
 
-    def recognizeFaces(self, frame):
+    def recognizeFaces(self, frame, regions=None):
         small_frame = cv2.resize(frame, (0,0), fx=self.frame_resize, fy=self.frame_resize)
 
-        # 人臉偵測
-        faces = faceMgr.face_app.get(small_frame)  # 偵測 + 對齊 + 抽特徵
+        # 人臉偵測 (只偵測，特徵等確定哪些 track 需要辨識後再一次 batch 抽)
+        # regions: 候選區域 (原圖座標，例如動靜 / 人物框)，None = 整張偵測
+        # 上一幀追蹤中的人臉也算候選區域，人站著不動沒有動靜時臉才不會跟丟；完全沒有區域就不偵測
+        # 每 FACE_DETECT_INTERVAL 幀偵測一次，中間幀用光流推算 (推算不可信就改跑偵測)；推算的臉只追蹤不送辨識
+        gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY) if self.flowTracker.detect_interval > 1 else None
+        faces = None if self.flowTracker.needsDetection(gray) else self.flowTracker.propagate(gray)
+        detected = faces is None
+        if detected:
+            if regions is None:
+                faces = faceMgr.detectFaces(small_frame, self.detect_source)
+            else:
+                small_regions = [tuple(v * self.frame_resize for v in region) for region in regions] + self.last_face_boxes
+                faces = faceMgr.detectFacesInRegions(small_frame, small_regions, self.detect_source)
+            self.flowTracker.reset(gray, faces)
         bboxes = []
         scores = []
         for f in faces:
@@ -57,16 +73,28 @@ class FaceRecognition:
 
         # 追蹤
         tracks = self.trackerMgr.objectTrack(small_frame, bboxes, scores)
+        det_indices = self.trackerMgr.matchDetections(tracks, bboxes)
 
-        info = []
-        for (x1, y1, x2, y2, track_id) in tracks:
-            small_crop, crop = self.getCrop(int(x1), int(y1), int(x2), int(y2), frame, small_frame, self.frame_resize)
-            name = faceMgr.recognizeFaces(small_crop, crop, track_id)
+        # 需要辨識的 track：對齊後送出 (非同步模式由 worker batch 抽特徵 + 搜尋，結果出來前顯示 Pending)
+        tracked = []
+        pending = []
+        for (x1, y1, x2, y2, track_id), det_idx in zip(tracks.tolist(), det_indices.tolist()):
+            track_key = self.trackerMgr.trackKey(track_id)
+            tracked.append((x1, y1, x2, y2, track_id, track_key))
+            if detected and det_idx >= 0 and faceMgr.needsRecognition(track_key):
+                small_crop, crop = self.getCrop(int(x1), int(y1), int(x2), int(y2), frame, small_frame, self.frame_resize)
+                pending.append((track_key, small_frame, faces[det_idx], crop))
+
+        faceMgr.submitFaces(pending)
+        self.last_face_boxes = [(x1, y1, x2, y2) for (x1, y1, x2, y2, _, _) in tracked]
 
+        info = []
+        for (x1, y1, x2, y2, track_id, track_key) in tracked:
             # resize 回原大小
             info.append({
                         "track_id": track_id,
-                        "name": name,  # 如果已經追中到就用快取的
+                        "track_key": track_key,
+                        "name": faceMgr.getDisplayName(track_key),  # 如果已經追中到就用快取的
                         "bbox": (int(x1 / self.frame_resize),
                                 int(y1 / self.frame_resize),
                                 int(x2 / self.frame_resize),
@@ -97,9 +125,12 @@ class FaceRecognition:
         
         return frame
 
-    def start(self, frame):
+    def getCacheSizes(self):
+        return {**self.trackerMgr.getCacheSizes(), "face_flow": self.flowTracker.getStats()}
+
+    def start(self, frame, regions=None):
         # Recognize Faces
-        face_info = self.recognizeFaces(frame)
+        face_info = self.recognizeFaces(frame, regions)
         frame = self.draw(frame, face_info)
 
         # show results
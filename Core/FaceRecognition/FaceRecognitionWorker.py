@@ -0,0 +1,75 @@
+import queue
+import threading
+
+# 非同步人臉辨識：camera thread 只負責偵測 + 對齊，把 (track_key, 對齊後的臉, best shot, 品質權重) 丟進有上限的佇列
+# worker 一次取出多筆做 batch 抽特徵 + 搜尋，結果寫回 face_manager.face_cache
+# track 結束的請求直接丟掉，不會再寫回快取
+class FaceRecognitionWorker:
+    def __init__(self, face_manager, workers=1, queue_size=64, batch_size=16):
+        self.face_manager = face_manager
+        self.batch_size = batch_size
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.pending = set()  # 已送出但還沒有結果的 track_key
+        self.stats = {"submitted": 0, "completed": 0, "dropped_full": 0, "dropped_stale": 0}
+        self.threads = [threading.Thread(target=self.run, name=f"FaceRecognitionWorker-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def isPending(self, track_key):
+        return track_key in self.pending
+
+    def submit(self, track_key, aligned, best_shot, weight=1.0):
+        # 佇列滿了就放棄這次 (下一幀會再送)，不會卡住 camera thread
+        if track_key in self.pending:
+            return False
+        self.pending.add(track_key)
+        try:
+            self.requests.put_nowait((track_key, aligned, best_shot, weight))
+        except queue.Full:
+            self.pending.discard(track_key)
+            self.stats["dropped_full"] += 1
+            return False
+        self.stats["submitted"] += 1
+        return True
+
+    def cancel(self, track_key):
+        # 呼叫端需持有 face_manager.result_lock
+        self.pending.discard(track_key)
+
+    def nextBatch(self):
+        batch = [self.requests.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            requests = self.nextBatch()
+            batch = [item for item in requests if item[0] in self.pending]
+            self.stats["dropped_stale"] += len(requests) - len(batch)
+            if not batch:
+                continue
+            try:
+                embeddings = self.face_manager.embedAligned([aligned for _, aligned, _, _ in batch])
+                with self.face_manager.result_lock:
+                    # 抽特徵期間 track 可能已經結束
+                    items = [(track_key, best_shot, emb, weight) for (track_key, _, best_shot, weight), emb in zip(batch, embeddings) if track_key in self.pending]
+                    self.stats["dropped_stale"] += len(batch) - len(items)
+                    self.face_manager.compareFacesBatch(self.face_manager.aggregateEmbeddings(items))
+                    self.stats["completed"] += len(items)
+            except Exception as e:
+                print(f"[辨識] worker 錯誤: {e}")
+                with self.face_manager.result_lock:
+                    for track_key, _, _, _ in batch:
+                        if track_key in self.pending:  # track 還在：清掉這次的排程，下一幀再送
+                            self.face_manager.restoreAttempt(track_key)
+            finally:
+                with self.face_manager.result_lock:
+                    for track_key, _, _, _ in batch:
+                        self.pending.discard(track_key)
+
+    def getStats(self):
+        return dict(self.stats, pending=len(self.pending), queued=self.requests.qsize())
@@ -0,0 +1,67 @@
+import numpy as np
+
+# 只在候選區域 (動靜、人物框、上一幀的人臉) 找臉：區域外擴、裁切到影像內、重疊的合併，
+# 再把所有區域排進同一張拼圖，偵測器只跑一次
+
+
+def prepareRegions(regions, shape, padding=0.25, min_size=16):
+    # regions: [(x1, y1, x2, y2)] (影像座標)，每邊外擴 padding 倍的寬 / 高，回傳合併後的 int 框
+    height, width = shape[:2]
+    boxes = []
+    for x1, y1, x2, y2 in regions:
+        pad_x, pad_y = (x2 - x1) * padding, (y2 - y1) * padding
+        box = [max(int(x1 - pad_x), 0), max(int(y1 - pad_y), 0), min(int(x2 + pad_x), width), min(int(y2 + pad_y), height)]
+        if box[2] - box[0] >= min_size and box[3] - box[1] >= min_size:
+            boxes.append(box)
+
+    # 重疊的框合併成外接框，直到沒有重疊 (區域數很少，直接兩兩比對)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+def packRegions(boxes, max_width=None, gap=16):
+    # shelf packing：由高到矮一列一列往右排，超過 max_width 就換列，區域之間留 gap 避免臉跨到隔壁
+    # 偵測器會把拼圖的長邊縮到 det_size，拼圖越接近正方形每張臉縮得越少；
+    # 沒指定 max_width 就試「每列放 k 個最寬的區域」的各種寬度，取長邊最短的
+    # 回傳 (每個框在拼圖上的左上角 [(x, y)], (拼圖寬, 拼圖高))
+    if max_width is None:
+        widths = sorted((x2 - x1 for x1, y1, x2, y2 in boxes), reverse=True)
+        candidates = [sum(widths[:k]) + gap * (k - 1) for k in range(1, len(widths) + 1)]
+        return min((packShelves(boxes, width, gap) for width in candidates),
+                   key=lambda packed: (max(packed[1]), packed[1][0] * packed[1][1]))
+    return packShelves(boxes, max_width, gap)
+
+
+def packShelves(boxes, max_width, gap):
+    max_width = max([max_width] + [x2 - x1 for x1, y1, x2, y2 in boxes])
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][3] - boxes[i][1], reverse=True)
+    positions = [None] * len(boxes)
+    x, y, shelf_height, canvas_width = 0, 0, 0, 0
+    for i in order:
+        w, h = boxes[i][2] - boxes[i][0], boxes[i][3] - boxes[i][1]
+        if x > 0 and x + w > max_width:
+            x, y, shelf_height = 0, y + shelf_height + gap, 0
+        positions[i] = (x, y)
+        canvas_width = max(canvas_width, x + w)
+        shelf_height = max(shelf_height, h)
+        x += w + gap
+    return positions, (canvas_width, y + shelf_height)
+
+
+def buildMosaic(img, boxes, positions, size):
+    canvas = np.zeros((size[1], size[0], 3), dtype=img.dtype)
+    for (x1, y1, x2, y2), (x, y) in zip(boxes, positions):
+        canvas[y:y + y2 - y1, x:x + x2 - x1] = img[y1:y2, x1:x2]
+    return canvas
@@ -1,5 +1,7 @@
 import datetime
 import os
+import re
+import time
 import cv2
 import numpy as np
 from pathlib import Path
@@ -10,84 +12,111 @@ class FaceSelfLearning:
             raise ValueError("known_path 不能為空字串！請提供有效的人臉資料庫路徑。")
             
         self.known_path = known_path
-        self.learning_cache = {}  # {track_id: {"candidate_name": str, "distances": [float] "crops": [np.array]}}
+        # 學習緩衝：只累積距離，特徵和 crop 只留距離最小的一張；有數量上限，太久沒更新的 track 會被清掉
+        self.learning_cache = {}  # {track_key: {"candidate_name": str, "distances": [float], "best_distance": float, "best_embedding": np.array, "best_crop": np.array, "updated_at": float}}
         self.learning_threshold_min = 1.1  # 最小距離閾值（原本的識別閾值）
         self.learning_threshold_max = 2.0  # 最大距離閾值
         self.learning_consecutive_count = 5  # 需要連續匹配的次數
+        self.learning_max_tracks = 32  # 同時學習中的 track 上限
+        self.learning_ttl = 60.0  # 秒，超過這段時間沒有新的匹配就放棄
 
-    def isLearning(self, track_id):
-        return track_id in self.learning_cache
+    def isLearning(self, track_key):
+        return track_key in self.learning_cache
     
-    def getLearningFaceName(self, track_id):
-        if track_id in self.learning_cache:
-            return self.learning_cache[track_id]["candidate_name"]
+    def getLearningFaceName(self, track_key):
+        if track_key in self.learning_cache:
+            return self.learning_cache[track_key]["candidate_name"]
         return "None"
 
-    def learning(self, super, known_dir, track_id, candidate_name, distance, crop_frame):
-        if track_id not in self.learning_cache:
+    def onTrackEnded(self, track_key):
+        # track 結束但沒學完，丟掉累積的資料
+        self.learning_cache.pop(track_key, None)
+
+    def evictExpired(self, now):
+        for track_key in [k for k, v in self.learning_cache.items() if now - v["updated_at"] > self.learning_ttl]:
+            print(f"[學習] Track {track_key} 超過 {self.learning_ttl:.0f} 秒沒有更新，放棄學習")
+            del self.learning_cache[track_key]
+        # 超過上限時丟掉最久沒更新的
+        while len(self.learning_cache) >= self.learning_max_tracks:
+            oldest = min(self.learning_cache, key=lambda k: self.learning_cache[k]["updated_at"])
+            del self.learning_cache[oldest]
+
+    def newRecord(self, candidate_name, distance, crop_frame, embedding, now):
+        return {
+            "candidate_name": candidate_name,
+            "distances": [distance],
+            "best_distance": distance,
+            "best_embedding": embedding,
+            "best_crop": crop_frame.copy(),
+            "updated_at": now,
+        }
+
+    def learning(self, face_manager, track_key, candidate_name, distance, crop_frame, embedding):
+        now = time.time()
+        if track_key not in self.learning_cache:
             # 初始化學習記錄
-            self.learning_cache[track_id] = {
-                "candidate_name": candidate_name,
-                "distances": [distance],
-                "crops": [crop_frame.copy()]
-            }
-            print(f"[學習] Track {track_id} 開始學習候選人: {candidate_name}, 距離: {distance:.4f}")
+            self.evictExpired(now)
+            self.learning_cache[track_key] = self.newRecord(candidate_name, distance, crop_frame, embedding, now)
+            print(f"[學習] Track {track_key} 開始學習候選人: {candidate_name}, 距離: {distance:.4f}")
         else:
+            record = self.learning_cache[track_key]
             # 檢查是否是同一個候選人
-            if self.learning_cache[track_id]["candidate_name"] == candidate_name:
-                # 累積證據
-                self.learning_cache[track_id]["distances"].append(distance)
-                self.learning_cache[track_id]["crops"].append(crop_frame.copy())
+            if record["candidate_name"] == candidate_name:
+                # 累積證據 (只保留最好的一張)
+                record["distances"].append(distance)
+                record["updated_at"] = now
+                if distance < record["best_distance"]:
+                    record["best_distance"] = distance
+                    record["best_embedding"] = embedding
+                    record["best_crop"] = crop_frame.copy()
                 
-                count = len(self.learning_cache[track_id]["distances"])
-                avg_distance = np.mean(self.learning_cache[track_id]["distances"])
+                count = len(record["distances"])
+                avg_distance = np.mean(record["distances"])
                 
-                #print(f"[學習] Track {track_id} 累積 {count}/{self.learning_consecutive_count} 次匹配到 {candidate_name}, 平均距離: {avg_distance:.4f}")
+                #print(f"[學習] Track {track_key} 累積 {count}/{self.learning_consecutive_count} 次匹配到 {candidate_name}, 平均距離: {avg_distance:.4f}")
                 
                 # 檢查是否達到學習條件
                 if count >= self.learning_consecutive_count:
-                    self.addKnownFace(track_id)
-
-                    super.loadKnownFaces(known_dir)
+                    # 直接把學到的特徵加進現有索引，不重新偵測、不重新掃描整個 KnownFaces
+                    save_path, best_embedding = self.addKnownFace(track_key)
+                    face_manager.addKnownEmbedding(candidate_name, best_embedding, save_path)
                     print("[學習完成] 人臉資料庫更新完成!")
 
             else:
                 # 候選人改變，重新開始
-                print(f"[學習] Track {track_id} 候選人從 {self.learning_cache[track_id]['candidate_name']} 變為 {candidate_name}, 重新開始學習")
-                self.learning_cache[track_id] = {
-                    "candidate_name": candidate_name,
-                    "distances": [distance],
-                    "crops": [crop_frame.copy()]
-                }
+                print(f"[學習] Track {track_key} 候選人從 {record['candidate_name']} 變為 {candidate_name}, 重新開始學習")
+                self.learning_cache[track_key] = self.newRecord(candidate_name, distance, crop_frame, embedding, now)
 
-    def addKnownFace(self, track_id):
-        if track_id not in self.learning_cache:
-            return
+    def addKnownFace(self, track_key):
+        if track_key not in self.learning_cache:
+            return None, None
             
-        learning_data = self.learning_cache[track_id]
+        learning_data = self.learning_cache[track_key]
         candidate_name = learning_data["candidate_name"]
         
-        # 選擇最好的樣本（距離最小的）
-        best_idx = np.argmin(learning_data["distances"])
-        best_crop = learning_data["crops"][best_idx]
-        best_distance = learning_data["distances"][best_idx]
+        # 最好的樣本（距離最小的）
+        best_crop = learning_data["best_crop"]
+        best_distance = learning_data["best_distance"]
+        best_embedding = learning_data["best_embedding"]
         
         # 保存圖片到對應人名資料夾
         person_dir = Path(self.known_path) / candidate_name
         person_dir.mkdir(exist_ok=True)
         
-        # 生成唯一檔案名
+        # 生成唯一檔案名：track id 只在同一個追蹤器內唯一，要加上 stream / 追蹤器名稱 (URL 等字元換掉)，時間到毫秒
         now = datetime.datetime.now()
-        timestamp = now.strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"learned_{track_id}_{timestamp}.png"
+        timestamp = now.strftime("%Y-%m-%d_%H-%M-%S-%f")[:-3]
+        track_name = re.sub(r"[^0-9A-Za-z]+", "-", "_".join(str(part) for part in track_key)).strip("-")
+        filename = f"learned_{track_name}_{timestamp}.png"
         save_path = person_dir / filename
         
         # 儲存
         cv2.imwrite(str(save_path), best_crop)
         
         print(f"[學習完成] 已保存新樣本到: {save_path}")
-        print(f"[學習完成] Track {track_id} 學習到 {candidate_name}, 最佳距離: {best_distance:.4f}")
+        print(f"[學習完成] Track {track_key} 學習到 {candidate_name}, 最佳距離: {best_distance:.4f}")
         
         # 清除學習記錄
-        del self.learning_cache[track_id]
+        del self.learning_cache[track_key]
+        return save_path, best_embedding
     
\ No newline at end of file
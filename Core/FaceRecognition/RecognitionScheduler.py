@@ -0,0 +1,53 @@
+import time
+
+# 還沒認出來 (Unknown) 的 track 重新辨識的排程：每次嘗試後間隔加倍 (指數退避)，直到 max_interval
+# 品質大幅提升或轉頭角度明顯改變時重置間隔，立刻再試
+class RecognitionScheduler:
+    def __init__(self, base_interval=0.5, max_interval=8.0, factor=2.0, reset_score_ratio=1.5, reset_yaw=0.25):
+        self.base_interval = base_interval  # 秒
+        self.max_interval = max_interval
+        self.factor = factor
+        self.reset_score_ratio = reset_score_ratio  # 品質分數是上次嘗試的幾倍才算大幅提升
+        self.reset_yaw = reset_yaw  # yaw 和上次嘗試相差多少才算換了角度
+        self.schedule = {}  # {track_key: {"next": timestamp, "interval": float, "score": float, "yaw": float}}
+        self.stats = {"attempts": 0, "saved": 0, "resets": 0}
+
+    def isSignificantChange(self, track_key, quality):
+        last = self.schedule.get(track_key)
+        if last is None:
+            return False
+        return (quality["score"] >= last["score"] * self.reset_score_ratio
+                or abs(quality["yaw"] - last["yaw"]) >= self.reset_yaw)
+
+    def shouldAttempt(self, track_key, quality, now=None, backoff=True):
+        # 決定這次要不要抽特徵，要的話記錄為一次嘗試並排好下一次；backoff=False 時間隔固定為 base_interval (例如學習中)
+        now = time.time() if now is None else now
+        entry = self.schedule.get(track_key)
+        if entry is None:
+            interval = self.base_interval
+        elif self.isSignificantChange(track_key, quality):
+            interval = self.base_interval
+            self.stats["resets"] += 1
+        elif now >= entry["next"]:
+            interval = min(entry["interval"] * self.factor, self.max_interval) if backoff else self.base_interval
+        else:
+            self.stats["saved"] += 1
+            return False
+
+        self.schedule[track_key] = {"next": now + interval, "interval": interval, "score": quality["score"], "yaw": quality["yaw"]}
+        self.stats["attempts"] += 1
+        return True
+
+    def restore(self, track_key, entry):
+        # 這次嘗試沒有真的抽到特徵 (佇列滿 / 抽特徵失敗)：還原成嘗試前的排程 (entry 為 None 就刪掉)，下一幀可以再試
+        if entry is None:
+            self.schedule.pop(track_key, None)
+        else:
+            self.schedule[track_key] = entry
+        self.stats["attempts"] -= 1
+
+    def onTrackEnded(self, track_key):
+        self.schedule.pop(track_key, None)
+
+    def getStats(self):
+        return dict(self.stats, tracks=len(self.schedule))
@@ -0,0 +1,123 @@
+import time
+from collections import deque
+import numpy as np
+
+# 最近出現過的陌生人 (Unknown) 特徵，有 TTL 和數量上限
+# 同一個陌生人離開再回來 / 追蹤斷掉重新抓到會拿到新的 track_id，新 track 的特徵和最近的陌生人夠像就沿用他的身分 (unknown_id)、
+# 人臉庫搜尋結果和告警狀態，不用再搜尋一次，也不會再告警 / 上傳
+# 數量很少 (預設最多 256 筆)，直接用矩陣內積，不另外建 FAISS 索引
+class UnknownFaceCache:
+    def __init__(self, ttl=60.0, max_size=256, threshold=0.8):
+        self.ttl = ttl  # 秒，超過這段時間沒再看到就忘記
+        self.max_size = max_size
+        self.threshold = threshold  # L2² 距離，比辨識閾值 (1.1) 嚴格，避免把不同的陌生人當成同一個
+        self.entries = {}  # {unknown_id: {"embedding": np.array, "distance": float, "candidate_name": str, "alerted": bool, "updated_at": float}}
+        self.track_ids = {}  # {track_key: unknown_id}
+        self.next_id = 1
+        # 人臉庫的變動 (載入 / 熱更新 / 自我學習)，下次 match 時才套用 (呼叫端可能在別的執行緒、沒有持有 result_lock)
+        self.invalidations = deque()  # [(新加入的特徵 or None, 被移除的人名)]
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0, "invalidated": 0}
+
+    def evictExpired(self, now):
+        for unknown_id in [k for k, v in self.entries.items() if now - v["updated_at"] > self.ttl]:
+            del self.entries[unknown_id]
+            self.stats["evicted"] += 1
+        # 超過上限時丟掉最久沒看到的
+        while len(self.entries) > self.max_size:
+            oldest = min(self.entries, key=lambda k: self.entries[k]["updated_at"])
+            del self.entries[oldest]
+            self.stats["evicted"] += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def invalidate(self, embeddings=None, names=()):
+        # 人臉庫有變動：只丟掉搜尋結果可能改變的陌生人，其他陌生人的身分和告警狀態照樣保留
+        # embeddings: 新加入的特徵，比快取的最近距離還近就表示搜尋結果會變；names: 被移除 / 更新的人，候選是他的要重新搜尋
+        # 兩個都沒給 = 整個人臉庫重新載入，全部清掉
+        self.invalidations.append((None if embeddings is None else np.asarray(embeddings, dtype=np.float32).reshape(-1, 512), set(names)))
+
+    def applyInvalidations(self):
+        while self.invalidations:
+            embeddings, names = self.invalidations.popleft()
+            if embeddings is None and not names:
+                self.stats["invalidated"] += len(self.entries)
+                self.clear()
+                continue
+            for unknown_id in list(self.entries):
+                entry = self.entries[unknown_id]
+                stale = entry["candidate_name"] in names
+                if not stale and embeddings is not None and len(embeddings):
+                    stale = float(np.min(2.0 - 2.0 * (embeddings @ entry["embedding"]))) < entry["distance"]
+                if stale:
+                    del self.entries[unknown_id]
+                    self.stats["invalidated"] += 1
+
+    def match(self, track_keys, embeddings, now=None):
+        # 回傳每個 query 對應的 unknown_id (沒有夠像的為 None)
+        # 只比對還沒有陌生人身分的新 track，已經有的 track 重試時照常搜尋人臉庫 (可能這次拍得比較清楚)
+        now = time.time() if now is None else now
+        self.applyInvalidations()
+        self.evictExpired(now)
+        results = [None] * len(track_keys)
+        queries = [q for q, track_key in enumerate(track_keys) if track_key not in self.track_ids]
+        if not self.entries or not queries:
+            self.stats["misses"] += len(queries)
+            return results
+
+        ids = list(self.entries)
+        gallery = np.stack([self.entries[unknown_id]["embedding"] for unknown_id in ids])
+        D = 2.0 - 2.0 * (np.asarray(embeddings, dtype=np.float32)[queries] @ gallery.T)  # L2²
+        best = np.argmin(D, axis=1)
+        for row, (q, idx) in enumerate(zip(queries, best)):
+            if D[row, idx] < self.threshold:
+                results[q] = ids[idx]
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+        return results
+
+    def get(self, unknown_id):
+        return self.entries.get(unknown_id)
+
+    def remember(self, track_key, embedding, distance, candidate_name, now=None):
+        # 記下 (或更新) 這個 track 的陌生人特徵和搜尋結果，回傳 unknown_id
+        now = time.time() if now is None else now
+        unknown_id = self.track_ids.get(track_key)
+        entry = self.entries.get(unknown_id)
+        if entry is None:
+            if unknown_id is None:
+                unknown_id = self.next_id
+                self.next_id += 1
+            entry = self.entries[unknown_id] = {"alerted": False}
+        entry.update(embedding=embedding, distance=distance, candidate_name=candidate_name, updated_at=now)
+        self.track_ids[track_key] = unknown_id
+        return unknown_id
+
+    def attach(self, track_key, unknown_id, now=None):
+        # 新 track 沿用最近的陌生人
+        self.track_ids[track_key] = unknown_id
+        self.entries[unknown_id]["updated_at"] = time.time() if now is None else now
+
+    def forget(self, track_key):
+        # 這個 track 認出是誰了，他對應的陌生人也不用再記
+        unknown_id = self.track_ids.pop(track_key, None)
+        if unknown_id is not None:
+            self.entries.pop(unknown_id, None)
+
+    def claimAlarm(self, track_key):
+        # None = 還不知道這個 track 是哪個陌生人，True = 這個陌生人已經告警過，False = 第一次 (同時記為已告警)
+        entry = self.entries.get(self.track_ids.get(track_key))
+        if entry is None:
+            return None
+        if entry["alerted"]:
+            return True
+        entry["alerted"] = True
+        return False
+
+    def onTrackEnded(self, track_key):
+        # 只清 track 對應，陌生人本身留到 TTL，同一個人回來才接得上
+        self.track_ids.pop(track_key, None)
+
+    def getStats(self):
+        return dict(self.stats, entries=len(self.entries), tracks=len(self.track_ids))
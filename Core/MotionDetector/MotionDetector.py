@@ -16,22 +16,42 @@ class MotionDetector:
         self.alarmCounterForDisplay = 0
         self.alarmTriggerCounter = 0
 
-    def detect(self, frame):
-        motion_detected_flag = False
+    def diff(self, frame):
+        # 和前一幀相減後的二值圖 (第一幀回傳 None)，只算差異、不計數也不告警
         # frame = imutils.resize(frame, width=500)
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         gray = cv2.GaussianBlur(gray, (21, 21), 0)
 
         # 初始化前一幀 (才能比較)
-        if self.pre_frame is None:
+        if self.pre_frame is None or self.pre_frame.shape != gray.shape:
             self.pre_frame = gray
-            return False, frame, None
+            return None
 
         # 偵測
         delta_frame = cv2.absdiff(self.pre_frame, gray)
         thresh = cv2.threshold(delta_frame, self.color_threshold, 255, cv2.THRESH_BINARY)[1]
         thresh = cv2.dilate(thresh, None, iterations=2) # 擴大白色區域、讓物體輪廓更明顯、填補小洞
         self.pre_frame = gray
+        return thresh
+
+    def findRegions(self, thresh):
+        # 移動物體的外接框 [(x1, y1, x2, y2)]，面積太小的忽略
+        if thresh is None:
+            return []
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        regions = []
+        for contour in contours:
+            if cv2.contourArea(contour) < self.min_area:
+                continue
+            (x, y, w, h) = cv2.boundingRect(contour)
+            regions.append((x, y, x + w, y + h))
+        return regions
+
+    def detect(self, frame):
+        motion_detected_flag = False
+        thresh = self.diff(frame)
+        if thresh is None:
+            return False, frame, None
 
         # 動作的強度
         if thresh.sum() > self.motion_threshold: 
@@ -55,14 +75,9 @@ class MotionDetector:
         cv2.putText(frame, f"Threshold: {thresh.sum()}", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
         cv2.putText(frame, f"Counter: {self.alarmCounterForDisplay}", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
         
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        for contour in contours:
-            if cv2.contourArea(contour) < self.min_area:
-                continue
-
-            # draw bounding box
-            (x, y, w, h) = cv2.boundingRect(contour)
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        # draw bounding box
+        for (x1, y1, x2, y2) in self.findRegions(thresh):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
     
     def start(self, frame):
         motion_detected, frame, thresh = self.detect(frame)
@@ -1,46 +1,128 @@
 
 from polars import Enum
+import os
+import time
 import cv2
 from Core.MotionDetector.MotionDetector import MotionDetector
 from Manager.YoloManager import YoloManager
 from Manager.OCSortManager import OCSortManager
 from Manager.FontManager import fontMgr
 from Manager.LineAlarmManager import LineAlarmManager
-from Core.FaceRecognition.FaceManager import faceMgr
+from Core.FaceRecognition.FaceManager import faceMgr, isIdentified
 
 class State(Enum):
     MOTION_DETECTED = 0
     PERSON_DETECTED = 1
 
 class MotionPipeline:
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, stream=""):
         self.headless = headless
         self.state = State.MOTION_DETECTED
         self.motion_detector = MotionDetector(self.headless)
         self.objectDetectionMgr = YoloManager("yolo11m.pt")
-        self.trackerMgr = OCSortManager()
+        self.trackerMgr = OCSortManager(stream, "pipeline")
+        self.trackerMgr.addTrackEndListener(self.onTrackEnded)
+        self.trackerMgr.addTrackEndListener(faceMgr.onTrackEnded)
 
         self.motion_flag = False
         self.person_flag = False
         self.face_flag = False
 
-        self.cache = {}  # {track_id: {"name": str}} # 快取已識別的人臉
-
-        # 新增：每個 track 的告警狀態，確保同一 track_id 最多觸發兩次 (person, face)
-        self.alert_state = {}  # { track_id: {"person_alerted": bool, "face_alerted": bool} } 
+        self.cache = {}  # {track_key: {"name": str}} # 快取已識別的人臉
+
+        # 新增：每個 track 的告警狀態，確保同一 track 最多觸發兩次 (person, face)
+        self.alert_state = {}  # { track_key: {"person_alerted": bool, "face_alerted": bool, "first_seen": float, "unknown_synced": bool} } 
+        # 新 track 的陌生人告警先等一下人臉結果：如果是最近告警過的同一個陌生人 (換了 track_id) 就不再告警 / 上傳
+        self.person_alarm_delay = float(os.getenv("FACE_UNKNOWN_ALARM_DELAY", 1.0))  # 秒，等不到人臉結果就照常告警
+        self.pending_alarms = {}  # {track_key: 第一次看到時的畫面}，等待中 track 就結束了也要告警
+
+        # 人物 -> 人臉：只在人物框的頭部區域偵測一次，沒認出來就排程下一次重試，不是每一幀都重跑
+        self.head_ratio = 0.4  # 頭部區域佔人物框高度的比例
+        self.face_retry_interval = 0.5  # 秒
+        self.face_next_attempt = {}  # {track_key: timestamp}
+
+    def onTrackEnded(self, track_key):
+        # 還在等人臉結果的陌生人告警：track 結束前補發 (用第一次看到時的畫面)，除非已經確定是告警過的同一個陌生人
+        # (faceMgr.onTrackEnded 在這之後才清掉陌生人快取)
+        pending_frame = self.pending_alarms.pop(track_key, None)
+        state = self.alert_state.pop(track_key, None)
+        if pending_frame is not None and state is not None and not state["person_alerted"] and not faceMgr.claimUnknownAlarm(track_key):
+            LineAlarmManager.triggerAlarm(pending_frame, f"Motion Pipeline: 有陌生人!!! ID:{track_key[-1]}", track_key[-1])
+        self.cache.pop(track_key, None)
+        self.face_next_attempt.pop(track_key, None)
+
+    # 快照 (SnapshotManager)
+    def getState(self):
+        return {"cache": self.cache, "alert_state": self.alert_state}
+
+    def setState(self, state):
+        self.cache.update(state["cache"])
+        self.alert_state.update(state["alert_state"])
+
+    def getCacheSizes(self):
+        sizes = self.trackerMgr.getCacheSizes()
+        sizes["cache"] = len(self.cache)
+        sizes["alert_state"] = len(self.alert_state)
+        sizes["face_next_attempt"] = len(self.face_next_attempt)
+        sizes["pending_alarms"] = len(self.pending_alarms)
+        return sizes
         
     # alarm (順序一定是 person -> face)
-    def personAlarm(self, frame, track_id):
-        if track_id not in self.alert_state:
-            self.alert_state[track_id] = {"person_alerted": False, "face_alerted": False}
-        if not self.alert_state[track_id]["person_alerted"]:
-            LineAlarmManager.triggerAlarm(frame.copy(), f"Motion Pipeline: 有陌生人!!! ID:{track_id}", track_id)
-            self.alert_state[track_id]["person_alerted"] = True
+    def personAlarm(self, frame, track_key, now):
+        track_id = track_key[-1]
+        if track_key not in self.alert_state:
+            self.alert_state[track_key] = {"person_alerted": False, "face_alerted": False, "first_seen": now, "unknown_synced": False}
+        state = self.alert_state[track_key]
+        if state.get("unknown_synced"):  # 舊快照還原的 state 沒有這兩個欄位
+            return
+
+        # 知道是哪個陌生人後只問一次：已經告警過就沿用，否則記到這個陌生人身上 (之後回來的新 track 沿用)
+        already_alerted = faceMgr.claimUnknownAlarm(track_key)
+        if already_alerted is not None:
+            state["unknown_synced"] = True
+            if already_alerted:
+                state["person_alerted"] = True
+        if state["person_alerted"]:
+            self.pending_alarms.pop(track_key, None)
+            return
+        if already_alerted is None and now - state.get("first_seen", 0) < self.person_alarm_delay:
+            self.pending_alarms.setdefault(track_key, frame.copy())
+            return
+        self.pending_alarms.pop(track_key, None)
+        LineAlarmManager.triggerAlarm(frame.copy(), f"Motion Pipeline: 有陌生人!!! ID:{track_id}", track_id)
+        state["person_alerted"] = True
     
-    def faceAlarm(self, frame, track_id, name):
-        if name != "Unknown" and "學習中" not in name and not self.alert_state[track_id]["face_alerted"]:
+    def faceAlarm(self, frame, track_key, name):
+        track_id = track_key[-1]
+        if isIdentified(name) and not self.alert_state[track_key]["face_alerted"]:
             LineAlarmManager.triggerAlarm(frame.copy(), f"Motion Pipeline: 偵測到臉! ID:{track_id} Name:{name}", track_id)
-            self.alert_state[track_id]["face_alerted"] = True
+            self.alert_state[track_key]["face_alerted"] = True
+
+    def getHeadBox(self, frame, x1, y1, x2, y2):
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, frame.shape[1]), min(y2, frame.shape[0])
+        head_y2 = y1 + int((y2 - y1) * self.head_ratio)
+        return x1, y1, x2, head_y2
+
+    def recognizePersonFaces(self, frame, candidates):
+        # candidates: [(track_key, bbox)]；所有人的頭部區域一起偵測一次 (拼成一張圖)，再依臉的位置分回各 track
+        # 所有人的頭部人臉一起送出 batch 抽特徵、batch 搜尋
+        heads = [(track_key, self.getHeadBox(frame, *bbox)) for track_key, bbox in candidates]
+        heads = [(track_key, box) for track_key, box in heads if box[2] > box[0] and box[3] > box[1]]
+        if not heads:
+            return
+        faces = faceMgr.detectFacesInRegions(frame, [box for _, box in heads], (self.trackerMgr.stream, self.trackerMgr.name))
+
+        pending = []
+        for track_key, (x1, y1, x2, y2) in heads:
+            inside = [f for f in faces if x1 <= (f.bbox[0] + f.bbox[2]) / 2 < x2 and y1 <= (f.bbox[1] + f.bbox[3]) / 2 < y2]
+            if inside:
+                pending.append((track_key, frame, max(inside, key=lambda f: f.det_score), frame[y1:y2, x1:x2]))
+        if not pending:
+            return
+
+        self.face_flag = True
+        faceMgr.submitFaces([item for item in pending if faceMgr.needsRecognition(item[0])])
 
     def detect(self, frame):
         info = []
@@ -52,6 +134,9 @@ class MotionPipeline:
         if self.state == State.MOTION_DETECTED:
             motion_detected, motion_frame, thresh = self.motion_detector.start(frame.copy())
 
+            # 等待動靜時也要更新追蹤器，已離開的 track 才會結束並清除快取
+            self.trackerMgr.objectTrack(frame, [], [])
+
             if motion_detected:
                 self.state = State.PERSON_DETECTED
 
@@ -67,29 +152,35 @@ class MotionPipeline:
                 tracks = self.trackerMgr.start(frame.copy(), bboxes, scores)
 
                 # 有偵測到人則進入人臉辨識
-                name = "Unknown"
-                for (x1, y1, x2, y2, track_id) in tracks:
-                    self.personAlarm(frame, track_id)
-
-                    # 如果沒有在 cache 裡面，才進行人臉辨識
-                    if track_id not in self.cache:
-                        crop = frame[y1:y2, x1:x2]
-                        small_crop = cv2.resize(crop, (0,0), fx=0.5, fy=0.5)
-                        face = faceMgr.face_app.get(crop)
-                        if face:
-                            self.face_flag = True
-                            name = faceMgr.recognizeFaces(small_crop, crop, track_id)
-                            self.faceAlarm(frame, track_id, name)
-
+                now = time.time()
+                tracked = []
+                candidates = []
+                for (x1, y1, x2, y2, track_id) in tracks.tolist():
+                    track_key = self.trackerMgr.trackKey(track_id)
+                    self.personAlarm(frame, track_key, now)
+                    tracked.append((x1, y1, x2, y2, track_id, track_key))
+
+                    # 如果沒有在 cache 裡面，且到了這個 track 的重試時間，才進行人臉辨識
+                    if track_key not in self.cache and now >= self.face_next_attempt.get(track_key, 0):
+                        candidates.append((track_key, (x1, y1, x2, y2)))
+                        self.face_next_attempt[track_key] = now + self.face_retry_interval
+
+                self.recognizePersonFaces(frame, candidates)
+
+                for (x1, y1, x2, y2, track_id, track_key) in tracked:
+                    # 如果已經追中到就用快取的，否則沿用 faceMgr 最近一次的結果 (非同步辨識的結果可能晚幾幀才到)
+                    name = self.cache[track_key]["name"] if track_key in self.cache else faceMgr.getDisplayName(track_key)
+                    self.faceAlarm(frame, track_key, name)
                     info.append({
                         "track_id": track_id,
-                        "name": self.cache.get(track_id, {"name": name})["name"],  # 如果已經追中到就用快取的
+                        "track_key": track_key,
+                        "name": name,
                         "bbox": (x1, y1, x2, y2)
                     })
 
                     # 有辨識出名子且未在 cache
-                    if track_id not in self.cache and name != "Unknown" and "學習中" not in name:
-                        self.cache[track_id] = {"name": name}
+                    if track_key not in self.cache and isIdentified(name):
+                        self.cache[track_key] = {"name": name}
                     
                     
             # 沒有偵測到則回到 Motion Detection
@@ -20,7 +20,7 @@ class MotionTracker:
         self.trackerMgr.draw(frame, tracks)
 
         # Cross Line Detection
-        for track in tracks:
+        for track in tracks.tolist():
             x1, y1, x2, y2, track_id = track
             center = (int((x1 + x2) / 2), int((y1 + y2) / 2))
             cv2.circle(frame, center, 5, (255, 0, 0), -1)
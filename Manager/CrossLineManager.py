@@ -5,7 +5,7 @@ class CrossLineManager:
         self.headless = headless
         self.lines = [[(0, 0), (0, 0)]]  # 支援多條線，預設一條線
         self.drawing = False
-        self.prev_center = {} #存儲每個 track_id 的前一個位置
+        self.prev_center = {} #存儲每個 track_key 的前一個位置
 
         if self.headless:
             self.lines = []  # 初始化是為了給 opencv mouse callback 使用，否則預設沒有任何線段
@@ -25,9 +25,9 @@ class CrossLineManager:
             self.lines[0][1] = (x, y)
             self.drawing = False
 
-    def isCrossLine(self, center, track_id):
-        if track_id not in self.prev_center:
-            self.prev_center[track_id] = center
+    def isCrossLine(self, center, track_key):
+        if track_key not in self.prev_center:
+            self.prev_center[track_key] = center
             return False
 
         def side(p, a, b):
@@ -37,7 +37,7 @@ class CrossLineManager:
         # 檢查每一條線
         for i, line in enumerate(self.lines):
             # 計算前後兩個 frame 中人物相對於線所在的左邊還是右邊
-            side_prev = side(self.prev_center[track_id], line[0], line[1])
+            side_prev = side(self.prev_center[track_key], line[0], line[1])
             side_curr = side(center, line[0], line[1])
             
             # 如果符號不同，代表跨線
@@ -48,9 +48,12 @@ class CrossLineManager:
                 elif side_prev < 0 and side_curr > 0:
                     print(f"Line {i}: B→A")  # 從另一側回到線的一側
         
-        self.prev_center[track_id] = center
+        self.prev_center[track_key] = center
         return crossed
 
+    def onTrackEnded(self, track_key):
+        self.prev_center.pop(track_key, None)
+
     def drawLine(self, frame):
         for i, line in enumerate(self.lines):
             # 不同線條使用不同顏色
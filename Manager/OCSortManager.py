@@ -1,14 +1,35 @@
 import cv2
 import numpy as np
+from collections import deque
 from .OCSortTracker.ocsort import OCSort
+from .OCSortTracker.association import iou_batch, linear_assignment
+
+# 每一幀的追蹤輸出 (structured array)，iterate 時可用 tracks.tolist() 取得 (x1, y1, x2, y2, track_id) tuples
+TRACK_DTYPE = np.dtype([("x1", np.int32), ("y1", np.int32), ("x2", np.int32), ("y2", np.int32), ("track_id", np.int32)])
 
 class OCSortManager:
-    def __init__(self):
+    def __init__(self, stream="", name=""):
         self.tracker = OCSort(det_thresh=0.45, iou_threshold=0.3)
+        self.stream = stream  # 影像來源 (camera index / URL)
+        self.name = name  # 追蹤器名稱 (同一個 stream 可能有多個追蹤器)
         self.track_paths = {}  # {track_id: [points]}
+        self.track_end_listeners = []  # callback(track_key)，追蹤結束時通知，讓各元件清除自己的 per-track 狀態
+
+    def trackKey(self, track_id):
+        # track_id 只在同一個追蹤器內唯一，共用的快取都要用 (stream, tracker, id) 當 key
+        return (self.stream, self.name, track_id)
+
+    def addTrackEndListener(self, callback):
+        self.track_end_listeners.append(callback)
+
+    def emitTrackEnded(self, track_ids):
+        for track_id in track_ids:
+            self.track_paths.pop(track_id, None)
+            track_key = self.trackKey(track_id)
+            for callback in self.track_end_listeners:
+                callback(track_key)
 
     def objectTrack(self, frame, bboxes, scores):
-        results = []
         if len(bboxes) > 0:
             # Convert bboxes and scores to numpy array
             detections = []
@@ -21,29 +42,46 @@ class OCSortManager:
                 detections.append([x1, y1, x2, y2, score])
 
             detections = np.array(detections)
+        else:
+            # 沒有偵測也要更新，追蹤器才會老化並結束消失的 track
+            detections = np.empty((0, 5))
 
-            # update tracker
-            height, width = frame.shape[:2]
-            img_info = (height, width, 0)
-            img_size = (height, width)
-            tracks = self.tracker.update(detections, img_info, img_size)
-            for track in tracks:
-                x1, y1, x2, y2, track_id = map(int, track)
-    
-                # 更新路徑
-                if track_id not in self.track_paths:
-                    self.track_paths[track_id] = []
-                self.track_paths[track_id].append((x1 + (x2 - x1) // 2, y1 + (y2 - y1) // 2))
-
-                # 只保留最近 100 個點
-                if len(self.track_paths[track_id]) > 100:
-                    self.track_paths[track_id] = self.track_paths[track_id][-100:]
-                    
-                results.append((x1, y1, x2, y2, track_id))
+        # update tracker
+        height, width = frame.shape[:2]
+        img_info = (height, width, 0)
+        img_size = (height, width)
+        tracks = self.tracker.update(detections, img_info, img_size)
+
+        # 一次轉成 int32 structured array，不再逐個 track 建 tuple
+        results = np.empty(len(tracks), dtype=TRACK_DTYPE)
+        for i, field in enumerate(TRACK_DTYPE.names):
+            results[field] = tracks[:, i]
+
+        # 更新路徑
+        cx = results["x1"] + (results["x2"] - results["x1"]) // 2
+        cy = results["y1"] + (results["y2"] - results["y1"]) // 2
+        for track_id, center in zip(results["track_id"].tolist(), zip(cx.tolist(), cy.tolist())):
+            path = self.track_paths.setdefault(track_id, deque(maxlen=100))  # 只保留最近 100 個點
+            path.append(center)
+
+        self.emitTrackEnded(self.tracker.ended_ids)
         return results
     
+    def matchDetections(self, tracks, bboxes, iou_threshold=0.5):
+        # 找出每個 track 這一幀對應的偵測框 index (沒有則為 -1)，讓呼叫端沿用偵測階段已算好的結果
+        # 一對一配對 (和 OC-SORT 關聯相同的 linear assignment)，兩個重疊的 track 不會拿到同一個偵測框
+        indices = np.full(len(tracks), -1, dtype=int)
+        if len(tracks) == 0 or len(bboxes) == 0:
+            return indices
+        track_boxes = np.stack([tracks["x1"], tracks["y1"], tracks["x2"], tracks["y2"]], axis=1).astype(float)
+        iou = iou_batch(track_boxes, np.asarray(bboxes, dtype=float))
+        for track_idx, det_idx in linear_assignment(-iou):
+            if iou[track_idx, det_idx] >= iou_threshold:
+                indices[track_idx] = det_idx
+        return indices
+
     def draw(self, frame, tracks):
-        for track in tracks:
+        for track in tracks.tolist():
             x1, y1, x2, y2, track_id = track
             label = f"ID: {track_id}"
             cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
@@ -54,6 +92,29 @@ class OCSortManager:
             cv2.putText(frame, label, (x1, y1 - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
 
 
+    # 快照 (SnapshotManager)
+    def getState(self):
+        return {
+            "stream": self.stream,
+            "name": self.name,
+            "trackers": self.tracker.trackers,
+            "frame_count": self.tracker.frame_count,
+            "id_count": self.tracker.id_count,
+            "track_paths": self.track_paths,
+        }
+
+    def setState(self, state):
+        # 不同的影像來源不能沿用舊的 track
+        if (state["stream"], state["name"]) != (self.stream, self.name):
+            return
+        self.tracker.trackers = state["trackers"]
+        self.tracker.frame_count = state["frame_count"]
+        self.tracker.id_count = state["id_count"]
+        self.track_paths = state["track_paths"]
+
+    def getCacheSizes(self):
+        return {"trackers": len(self.tracker.trackers), "track_paths": len(self.track_paths)}
+
     def start(self, frame, bboxes, scores):
         tracks = self.objectTrack(frame, bboxes, scores)
         self.draw(frame, tracks)
@@ -384,6 +384,8 @@ class KalmanFilterNew(object):
         """
             Save the parameters before non-observation forward
         """
+        # drop the previous snapshot first, otherwise every freeze nests all older ones
+        self.attr_saved = None
         self.attr_saved = deepcopy(self.__dict__)
 
 
@@ -525,6 +527,9 @@ class KalmanFilterNew(object):
         self.x_post = self.x.copy()
         self.P_post = self.P.copy()
 
+        # unfreeze only needs the history since the last observation
+        del self.history_obs[:-1]
+
     def predict_steadystate(self, u=0, B=None):
         """
         Predict state (prior) using the Kalman filter state propagation
@@ -3,6 +3,7 @@
 """
 from __future__ import print_function
 
+from collections import deque
 import numpy as np
 from .association import *
 
@@ -54,13 +55,40 @@ def speed_direction(bbox1, bbox2):
     return speed / norm
 
 
+def _constant_velocity_model():
+    """
+    Matrices of the constant velocity model. They are identical for every track and never
+    modified in place by the filter, so they are built once and shared (P is copied per track).
+    """
+    F = np.array([[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [
+                0, 0, 0, 1, 0, 0, 0],  [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]])
+    H = np.array([[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0],
+                [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]])
+    R = np.eye(4)
+    R[2:, 2:] *= 10.
+    P = np.eye(7)
+    P[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
+    P *= 10.
+    Q = np.eye(7)
+    Q[-1, -1] *= 0.01
+    Q[4:, 4:] *= 0.01
+    for m in (F, H, R, P, Q):
+        m.flags.writeable = False
+    return F, H, R, P, Q
+
+
+MODEL_F, MODEL_H, MODEL_R, MODEL_P, MODEL_Q = _constant_velocity_model()
+
+
 class KalmanBoxTracker(object):
     """
     This class represents the internal state of individual tracked objects observed as bbox.
     """
+    __slots__ = ("kf", "time_since_update", "id", "history", "hits", "hit_streak", "age",
+                 "last_observation", "observations", "history_observations", "velocity", "delta_t", "cate")
     count = 0
 
-    def __init__(self, bbox, delta_t=3, orig=False):
+    def __init__(self, bbox, delta_t=3, orig=False, track_id=None, max_history=None):
         """
         Initialises a tracker using initial bounding box.
 
@@ -72,21 +100,18 @@ class KalmanBoxTracker(object):
         else:
           from filterpy.kalman import KalmanFilter
           self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array([[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [
-                            0, 0, 0, 1, 0, 0, 0],  [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]])
-        self.kf.H = np.array([[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0],
-                            [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]])
-
-        self.kf.R[2:, 2:] *= 10.
-        self.kf.P[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
-        self.kf.P *= 10.
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[4:, 4:] *= 0.01
+        self.kf.F = MODEL_F
+        self.kf.H = MODEL_H
+        self.kf.R = MODEL_R
+        self.kf.P = MODEL_P.copy()
+        self.kf.Q = MODEL_Q
 
         self.kf.x[:4] = convert_bbox_to_z(bbox)
         self.time_since_update = 0
-        self.id = KalmanBoxTracker.count
-        KalmanBoxTracker.count += 1
+        if track_id is None:
+            track_id = KalmanBoxTracker.count
+            KalmanBoxTracker.count += 1
+        self.id = track_id
         self.history = []
         self.hits = 0
         self.hit_streak = 0
@@ -97,10 +122,11 @@ class KalmanBoxTracker(object):
         fast and unified way, which you would see below k_observations = np.array([k_previous_obs(...]]), let's bear it for now.
         """
         self.last_observation = np.array([-1, -1, -1, -1, -1])  # placeholder
-        self.observations = dict()
-        self.history_observations = []
+        self.observations = dict()  # only the last delta_t ages are kept, see update()
+        self.history_observations = deque(maxlen=max_history)
         self.velocity = None
         self.delta_t = delta_t
+        self.cate = None
 
     def update(self, bbox):
         """
@@ -128,6 +154,10 @@ class KalmanBoxTracker(object):
             self.last_observation = bbox
             self.observations[self.age] = bbox
             self.history_observations.append(bbox)
+            # observations older than delta_t are never looked up again (here and in k_previous_obs),
+            # the newest one is always kept as the fallback
+            for age in [a for a in self.observations if a < self.age - self.delta_t]:
+                del self.observations[age]
 
             self.time_since_update = 0
             self.history = []
@@ -188,7 +218,14 @@ class OCSort(object):
         self.asso_func = ASSO_FUNCS[asso_func]
         self.inertia = inertia
         self.use_byte = use_byte
-        KalmanBoxTracker.count = 0
+        self.max_history = max(min_hits, delta_t) + 1  # history_observations is only read for head padding
+        self.ended_ids = []  # ids (+1, same as the output) of tracklets removed in the last update
+        self.id_count = 0  # per-instance id generator, ids never collide with another OCSort's counter
+
+    def next_id(self):
+        track_id = self.id_count
+        self.id_count += 1
+        return track_id
 
     def update(self, output_results, img_info, img_size):
         """
@@ -198,6 +235,7 @@ class OCSort(object):
         Returns the a similar array, where the last column is the object ID.
         NOTE: The number of objects returned may differ from the number of detections provided.
         """
+        self.ended_ids = []
         if output_results is None:
             return np.empty((0, 5))
 
@@ -232,6 +270,7 @@ class OCSort(object):
                 to_del.append(t)
         trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
         for t in reversed(to_del):
+            self.ended_ids.append(self.trackers[t].id+1)
             self.trackers.pop(t)
 
         velocities = np.array(
@@ -301,7 +340,8 @@ class OCSort(object):
 
         # create and initialise new trackers for unmatched detections
         for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :], delta_t=self.delta_t)
+            trk = KalmanBoxTracker(dets[i, :], delta_t=self.delta_t, track_id=self.next_id(),
+                                   max_history=self.max_history)
             self.trackers.append(trk)
         i = len(self.trackers)
         for trk in reversed(self.trackers):
@@ -319,12 +359,14 @@ class OCSort(object):
             i -= 1
             # remove dead tracklet
             if(trk.time_since_update > self.max_age):
+                self.ended_ids.append(trk.id+1)
                 self.trackers.pop(i)
         if(len(ret) > 0):
             return np.concatenate(ret)
         return np.empty((0, 5))
 
     def update_public(self, dets, cates, scores):
+        self.ended_ids = []
         self.frame_count += 1
 
         det_scores = np.ones((dets.shape[0], 1))
@@ -346,6 +388,7 @@ class OCSort(object):
                 to_del.append(t)
         trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
         for t in reversed(to_del):
+            self.ended_ids.append(self.trackers[t].id+1)
             self.trackers.pop(t)
 
         velocities = np.array([trk.velocity if trk.velocity is not None else np.array((0,0)) for trk in self.trackers])
@@ -400,7 +443,7 @@ class OCSort(object):
                 unmatched_trks = np.setdiff1d(unmatched_trks, np.array(to_remove_trk_indices))
 
         for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i,:])
+            trk = KalmanBoxTracker(dets[i,:], track_id=self.next_id(), max_history=self.max_history)
             trk.cate = cates[i]
             self.trackers.append(trk)
         i = len(self.trackers)
@@ -422,6 +465,7 @@ class OCSort(object):
                             [-(prev_i+1)]))).reshape(1,-1))
             i -= 1 
             if (trk.time_since_update > self.max_age):
+                  self.ended_ids.append(trk.id+1)
                   self.trackers.pop(i)
         
         if(len(ret)>0):
@@ -0,0 +1,86 @@
+import os
+import re
+import time
+import hashlib
+import pickle
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+
+# 定期把追蹤器與識別快取存到本地檔案，重啟後若快照夠新就還原，避免所有人重新辨識、重新告警
+# 註冊的物件需要提供 getState() / setState(state)
+class SnapshotManager:
+    def __init__(self):
+        self.CurFilePath = os.path.dirname(os.path.abspath(__file__))
+        self.enable = os.getenv("SNAPSHOT_ENABLE", "true").lower() in ("true", "1", "yes", "on")
+        self.path = os.getenv("SNAPSHOT_PATH", os.path.normpath(os.path.join(self.CurFilePath, "../Cache/snapshot.pkl")))
+        self.interval = float(os.getenv("SNAPSHOT_INTERVAL", 10))  # 秒
+        self.max_age = float(os.getenv("SNAPSHOT_MAX_AGE", 60))  # 秒，超過就視為過期不還原
+        self.providers = {}  # {name: object}
+        self.last_save = time.time()
+        self.write_lock = threading.Lock()
+
+    def setSource(self, source):
+        # 每個攝影機程序各存一份快照 (檔名加上攝影機代號)，多支攝影機同時跑才不會互相覆蓋、還原到別台的狀態
+        # 串流網址可能含帳密，不直接放進檔名，改用雜湊
+        source = str(source)
+        suffix = source if re.fullmatch(r"[\w.-]+", source) else hashlib.sha1(source.encode()).hexdigest()[:12]
+        root, ext = os.path.splitext(self.path)
+        self.path = f"{root}_{suffix}{ext}"
+
+    def register(self, name, provider):
+        self.providers[name] = provider
+
+    def save(self):
+        if not self.enable:
+            return
+        # 在呼叫端 (camera thread) 序列化，狀態才會一致；寫檔交給背景執行緒
+        snapshot = {
+            "saved_at": time.time(),
+            "states": {name: provider.getState() for name, provider in self.providers.items()},
+        }
+        data = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        self.last_save = snapshot["saved_at"]
+        threading.Thread(target=self.write, args=(data,), daemon=True).start()
+
+    def write(self, data):
+        with self.write_lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)  # 原子替換，避免讀到寫一半的檔案
+            except Exception as e:
+                print(f"[快照] 儲存失敗: {e}")
+
+    def update(self):
+        # 每一幀呼叫一次，到了間隔才真的存
+        if self.enable and time.time() - self.last_save >= self.interval:
+            self.save()
+
+    def restore(self):
+        if not self.enable or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print(f"[快照] 讀取失敗: {e}")
+            return False
+
+        age = time.time() - snapshot["saved_at"]
+        if age > self.max_age:
+            print(f"[快照] 快照已過期 ({age:.0f} 秒前)，不還原")
+            return False
+
+        for name, state in snapshot["states"].items():
+            if name in self.providers:
+                try:
+                    self.providers[name].setState(state)
+                except Exception as e:
+                    print(f"[快照] 還原 {name} 失敗: {e}")
+        print(f"[快照] 已還原 {age:.0f} 秒前的狀態: {', '.join(snapshot['states'].keys())}")
+        return True
+
+snapshotMgr = SnapshotManager()
@@ -135,6 +135,10 @@ class CameraServer:
             pipeline_info = httpMgr.get_pipeline_info()
             return jsonify(pipeline_info)
 
+        @self.app.route('/cache/info')
+        def get_cache_info():
+            return jsonify(self.processor.getCacheSizes())
+
         @self.app.route('/storage/image/<filename>', methods=['GET'])
         def get_image(filename):
             image_data = httpMgr.get_image(filename)
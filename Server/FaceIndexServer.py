@@ -0,0 +1,102 @@
+import os
+import queue
+import threading
+import numpy as np
+from multiprocessing.connection import Listener
+from dotenv import load_dotenv
+
+# 共用人臉索引服務：一個程序持有人臉庫 + FAISS 索引 (含熱更新、特徵快取)，多個攝影機程序透過 FaceIndexClient 查詢 / 新增
+# 啟動: python -m Server.FaceIndexServer (位址同 FACE_INDEX_SERVER，例如 localhost:6100 或 /tmp/face_index.sock)
+load_dotenv()
+ADDRESS = os.getenv("FACE_INDEX_SERVER", "localhost:6100")
+AUTHKEY = os.getenv("FACE_INDEX_AUTHKEY", "").encode()  # 沒有預設值，未設定就不啟動
+os.environ["FACE_INDEX_SERVER"] = ""  # 服務本身用本地索引 (load_dotenv 不會覆寫已存在的變數)
+os.environ["FACE_RECOGNITION_ASYNC"] = "false"  # 服務不做辨識，不需要 worker
+
+from Core.FaceRecognition.FaceManager import faceMgr
+from Core.FaceRecognition.FaceIndexClient import parseAddress
+
+
+class FaceIndexServer:
+    def __init__(self, address=ADDRESS, authkey=AUTHKEY, max_batch=256):
+        if not authkey:
+            raise RuntimeError("未設定 FACE_INDEX_AUTHKEY，索引服務不啟動 (任何人都能連線新增 / 查詢人臉)")
+        self.address = parseAddress(address)
+        self.authkey = authkey
+        self.max_batch = max_batch
+        self.searches = queue.Queue()  # (embeddings, result)，不同 client 的查詢合併成一次搜尋
+        self.stats = {"requests": 0, "queries": 0, "batches": 0}
+
+    def searchLoop(self):
+        while True:
+            pending = [self.searches.get()]
+            count = len(pending[0][0])
+            while count < self.max_batch:
+                try:
+                    pending.append(self.searches.get_nowait())
+                    count += len(pending[-1][0])
+                except queue.Empty:
+                    break
+            try:
+                D, names = faceMgr.searchKnownFaces(np.concatenate([embs for embs, _ in pending], axis=0))
+                error = None
+            except Exception as e:
+                D, names, error = None, None, str(e)
+            self.stats["batches"] += 1
+            start = 0
+            for embs, result in pending:
+                if error is None:
+                    result["response"] = {"distances": D[start:start + len(embs)], "names": names[start:start + len(embs)]}
+                else:
+                    result["response"] = {"error": error}
+                start += len(embs)
+                result["done"].set()
+
+    def search(self, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, 512)
+        self.stats["queries"] += len(embeddings)
+        result = {"done": threading.Event()}
+        self.searches.put((embeddings, result))
+        result["done"].wait()
+        return result["response"]
+
+    def handle(self, message):
+        op = message.get("op")
+        if op == "search":
+            return self.search(message["embeddings"])
+        if op == "add":
+            faceMgr.addKnownEmbedding(message["name"], message["embedding"], message.get("img_path"))
+            return {"status": "ok"}
+        if op == "info":
+            return {"faces": len(faceMgr.known_names), "index_type": faceMgr.faiss_index.index_type, **self.stats}
+        return {"error": f"未知的操作: {op}"}
+
+    def serveClient(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                self.stats["requests"] += 1
+                try:
+                    response = self.handle(message)
+                except Exception as e:
+                    response = {"error": str(e)}
+                conn.send(response)
+
+    def start(self):
+        threading.Thread(target=self.searchLoop, daemon=True).start()
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"[索引服務] 監聽 {self.address}，共 {len(faceMgr.known_names)} 個人臉")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"[索引服務] 連線失敗: {e}")
+                    continue
+                threading.Thread(target=self.serveClient, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    FaceIndexServer().start()